@@ -2,472 +2,1274 @@
 # 104119 Miguel Rego
 # 107316 Afonso Mateus
 
+import argparse
+import functools
+import itertools
+import json
+import math
+import os
+import random
 import sys
-from typing import List, Tuple, Set
+import time
+from array import array
+from typing import Iterator, List, Tuple, Set, Union
 import search
 from search import Node
-from collections import Counter
+from collections import Counter, deque
+
+
+# Each rotation is stored as a 4-bit connectivity mask with one bit per side
+# the piece opens to, and each cell domain as a 16-bit set over those masks
+# (bit m is set while mask m is still a possible rotation of the cell).
+UP, RIGHT, DOWN, LEFT = 1, 2, 4, 8
+
+PIECE_MASKS = {
+    "FC": UP, "FD": RIGHT, "FB": DOWN, "FE": LEFT,
+    "BC": UP | RIGHT | LEFT, "BD": UP | RIGHT | DOWN, "BB": RIGHT | DOWN | LEFT, "BE": UP | DOWN | LEFT,
+    "VC": UP | LEFT, "VD": UP | RIGHT, "VB": RIGHT | DOWN, "VE": DOWN | LEFT,
+    "LH": RIGHT | LEFT, "LV": UP | DOWN,
+}
+
+
+def mask_domains(values: bytes, domains: List[int]) -> array:
+    """Maps every mask in `values` through a 16-entry table of domains, in bulk:
+    the low and high bytes of the result are produced with bytes.translate."""
+    low = bytes(domain & 0xFF for domain in domains).ljust(256, b"\0")
+    high = bytes(domain >> 8 for domain in domains).ljust(256, b"\0")
+    buffer = bytearray(2 * len(values))
+    first, second = (0, 1) if sys.byteorder == "little" else (1, 0)
+    buffer[first::2] = values.translate(low)
+    buffer[second::2] = values.translate(high)
+    result = array("H")
+    result.frombytes(buffer)
+    return result
+
+
+def domain_values(domain: int) -> List[int]:
+    """Returns the rotation masks contained in a domain bitset."""
+    return [mask for mask in range(16) if domain >> mask & 1]
+
+
+def first_value(domain: int) -> int:
+    """Returns the lowest rotation mask contained in a domain bitset."""
+    return (domain & -domain).bit_length() - 1
+
+
+MASK_PIECES: List[str] = [""] * 16
+PIECE_ROTATIONS = {"F": 0, "B": 0, "V": 0, "L": 0}
+for _piece, _mask in PIECE_MASKS.items():
+    MASK_PIECES[_mask] = _piece
+    PIECE_ROTATIONS[_piece[0]] |= 1 << _mask
+
+# Byte tables used to decode piece codes in bulk: the type letter maps to the
+# high nibble, the orientation letter to the low one, and CODE_MASKS maps the
+# combined byte to the rotation mask (0xFF for codes that are not pieces).
+_type_codes, _orientation_codes, _code_masks = bytearray(256), bytearray(256), bytearray(b"\xff" * 256)
+for _code, _letter in enumerate(b"FBVL", 1):
+    _type_codes[_letter] = _code << 4
+for _code, _letter in enumerate(b"CBEDHV", 1):
+    _orientation_codes[_letter] = _code
+for _piece, _mask in PIECE_MASKS.items():
+    _code_masks[_type_codes[ord(_piece[0])] | _orientation_codes[ord(_piece[1])]] = _mask
+PIECE_TYPE_CODES, ORIENTATION_CODES, CODE_MASKS = bytes(_type_codes), bytes(_orientation_codes), bytes(_code_masks)
+
+# Domain of every rotation of the piece a mask belongs to, indexed by mask.
+MASK_ROTATIONS = [PIECE_ROTATIONS[piece[0]] if piece else 0 for piece in MASK_PIECES]
+
+# Domain of every mask that does not open to any of the sides in the index.
+CLOSED_ROTATIONS = [sum(1 << mask for mask in range(16) if not mask & sides) for sides in range(16)]
+
+END_PIECES = PIECE_ROTATIONS["F"]
+
+# Number of sides each mask opens to.
+OPEN_ENDS = [bin(mask).count("1") for mask in range(16)]
+
+# Directions are indexed clockwise from UP, so the opposite of k is (k + 2) % 4.
+DIRECTIONS = (UP, RIGHT, DOWN, LEFT)
+DIRECTION_OFFSETS = ((-1, 0), (0, 1), (1, 0), (0, -1))
+ALL_PIECES = sum(PIECE_ROTATIONS.values())
+
+
+def _compatible(direction: int, first: int, second: int) -> bool:
+    """Whether `second` may sit on the `direction` side of `first`: both open
+    the shared side or neither does, and two end pieces never face each other."""
+    opens = first >> direction & 1
+    if opens != second >> (direction + 2) % 4 & 1:
+        return False
+    return not (opens and END_PIECES >> first & 1 and END_PIECES >> second & 1)
+
+
+# COMPATIBLE[(k << 8) | (a << 4) | b] is 1 when b may be the neighbour of a in direction k.
+COMPATIBLE = bytes(_compatible(k, a, b) for k in range(4) for a in range(16) for b in range(16))
+
+# SUPPORT[k][a] is the domain of pieces that may be the neighbour of a in direction k.
+SUPPORT = [[sum(1 << b for b in domain_values(ALL_PIECES) if COMPATIBLE[(k << 8) | (a << 4) | b])
+            for a in range(16)] for k in range(4)]
+
+# SUPPORTED[k][domain] is the union of SUPPORT[k][a] over every a in a cell domain,
+# for every domain a cell can hold (any subset of the rotations of one piece).
+SUPPORTED = [{} for _ in range(4)]
+for _rotations in PIECE_ROTATIONS.values():
+    _values = domain_values(_rotations)
+    for _subset in range(1 << len(_values)):
+        _domain = sum(1 << value for bit, value in enumerate(_values) if _subset >> bit & 1)
+        for _k in range(4):
+            _supported = 0
+            for _value in domain_values(_domain):
+                _supported |= SUPPORT[_k][_value]
+            SUPPORTED[_k][_domain] = _supported
+
+
+# Longer nogoods are not worth checking and are not kept.
+MAX_NOGOOD_SIZE = 32
+
+# Boards with at least this many cells run their first propagation pass vectorized.
+VECTORIZE_CELLS = 100_000
+
+_supported_tables = None
+
+
+def supported_tables():
+    """SUPPORTED as four numpy lookup tables indexed by domain, built on first
+    use. The full domain 0xFFFF, which no cell holds, marks the padding around
+    the board and supports everything."""
+    global _supported_tables
+    if _supported_tables is None:
+        import numpy as np
+        _supported_tables = []
+        for supported in SUPPORTED:
+            table = np.zeros(1 << 16, dtype=np.uint16)
+            table[list(supported)] = list(supported.values())
+            table[0xFFFF] = 0xFFFF
+            _supported_tables.append(table)
+    return _supported_tables
+
+
+# OPEN_TOWARDS[k] is the domain of every mask that opens in direction k.
+OPEN_TOWARDS = [sum(1 << mask for mask in range(16) if mask >> k & 1) for k in range(4)]
+
+
+def pruning_rule(direction: int, domain: int) -> str:
+    """Names the propagation rule behind a pruning made across the `direction`
+    side of a cell with `domain`, for SolverStats."""
+    if domain & (domain - 1) == 0:
+        return "fixed_piece"
+    opening = domain & OPEN_TOWARDS[direction]
+    if opening == domain:
+        return "needs_connection"
+    if not opening:
+        return "blocked_side"
+    return "end_pieces"
+
+
+def direction_between(first_row: int, first_col: int, second_row: int, second_col: int):
+    """Returns the index of the direction going from the first cell to the
+    adjacent second one, or None if they are not adjacent."""
+    offset = (second_row - first_row, second_col - first_col)
+    return DIRECTION_OFFSETS.index(offset) if offset in DIRECTION_OFFSETS else None
+
+
+def check_compatibility_pair(first_piece: int, first_row: int, first_col: int, second_piece: int, second_row: int, second_col: int) -> bool:
+    """Based on a pair of pieces determines if they are connected to each other"""
+    direction = direction_between(first_row, first_col, second_row, second_col)
+    if direction is None:
+        return False
+    return bool(first_piece >> direction & 1 and COMPATIBLE[(direction << 8) | (first_piece << 4) | second_piece])
+
+
+def zobrist_key(index: int, value: int, domain: int) -> int:
+    """Pseudo-random 64-bit key of a cell holding a rotation and a domain,
+    derived with splitmix64 so no per-cell key table has to be stored."""
+    key = ((index << 20 | domain << 4 | value) + 1) * 0x9E3779B97F4A7C15 & 0xFFFFFFFFFFFFFFFF
+    key = (key ^ key >> 30) * 0xBF58476D1CE4E5B9 & 0xFFFFFFFFFFFFFFFF
+    key = (key ^ key >> 27) * 0x94D049BB133111EB & 0xFFFFFFFFFFFFFFFF
+    return key ^ key >> 31
+
+
+# Cells per chunk of a PipeManiaState, the unit copied when a child changes a cell.
+STATE_CHUNK = 64
 
 
 class PipeManiaState:
+    """An immutable version of a board: the rotations of its cells and their
+    domains (as native 16-bit words) in bytes chunks of STATE_CHUNK cells. A
+    child state shares every chunk with its parent except those holding the
+    cells it changed, so it costs those chunks and a tuple of references,
+    and states keep no link to their parents. `board` makes a Board of the
+    state's own, which the caller is free to keep or change. PipeMania.result
+    works a child out on the problem's board, which Board.checkout first
+    moves to the parent."""
     state_id = 0
 
-    def __init__(self, board: 'Board'):
-        self.board = board
+    def __init__(self, rows: int, cols: int, values: tuple, domain: tuple, depth: int = 0):
+        self.rows = rows
+        self.cols = cols
+        self.values = values
+        self.domain = domain
+        self.depth = depth
         self.id = PipeManiaState.state_id
         PipeManiaState.state_id += 1
+        self.dead = False  # some cell was left without rotations
+        self._zobrist = None
+        # (unresolved cells, rotations left over all cells, unsatisfied connections),
+        # from the parent's once those are known; see measure
+        self._measure = None
+
+    @classmethod
+    def from_board(cls, board: 'Board') -> 'PipeManiaState':
+        """The state of the current rotations and domains of a board."""
+        values, domain = bytes(board.values), board.domain.tobytes()
+        chunk = 2 * STATE_CHUNK
+        return cls(board.rows, board.cols,
+                   tuple(values[start:start + STATE_CHUNK] for start in range(0, len(values), STATE_CHUNK)),
+                   tuple(domain[start:start + chunk] for start in range(0, len(domain), chunk)))
+
+    def child(self, board: 'Board', cells) -> 'PipeManiaState':
+        """The state of `board`, which differs from this state in `cells` only.
+        Its hash and measure are worked out from this state's when known."""
+        values, domain = list(self.values), list(self.domain)
+        old = {}
+        for chunk in {index // STATE_CHUNK for index in cells}:
+            start = chunk * STATE_CHUNK
+            values[chunk] = bytes(board.values[start:start + STATE_CHUNK])
+            domain[chunk] = board.domain[start:start + STATE_CHUNK].tobytes()
+            old[chunk] = array("H", self.domain[chunk])
+        state = PipeManiaState(self.rows, self.cols, tuple(values), tuple(domain), self.depth + 1)
+        state.dead = any(board.domain[index] == 0 for index in cells)
+        if self._zobrist is not None:
+            fingerprint = self._zobrist
+            for index in cells:
+                chunk, offset = divmod(index, STATE_CHUNK)
+                fingerprint ^= zobrist_key(index, self.values[chunk][offset], old[chunk][offset]) ^ \
+                    zobrist_key(index, board.values[index], board.domain[index])
+            state._zobrist = fingerprint
+        if self._measure is not None:
+            rotations = self._measure[1]
+            for index in cells:
+                chunk, offset = divmod(index, STATE_CHUNK)
+                rotations += bin(board.domain[index]).count("1") - bin(old[chunk][offset]).count("1")
+            state._measure = (board.unresolved_count(), rotations, board.unsatisfied_count())
+        return state
+
+    @property
+    def board(self) -> 'Board':
+        domain = array("H")
+        domain.frombytes(b"".join(self.domain))
+        return Board(bytearray(b"".join(self.values)), self.rows, self.cols, domain)
+
+    @property
+    def zobrist(self) -> int:
+        """The Zobrist hash of the state, from its parent's when that was
+        known and otherwise over every cell when first needed."""
+        if self._zobrist is None:
+            self._zobrist = self.board.zobrist_hash()
+        return self._zobrist
 
     def __eq__(self, other):
         if not isinstance(other, PipeManiaState):
             return False
-        return self.board.serialize() == other.board.serialize()
+        if self.zobrist != other.zobrist:
+            return False
+        return self.values == other.values and self.domain == other.domain
 
     def __hash__(self):
-        return hash(self.board.serialize())
+        return self.zobrist
+
+    def __lt__(self, other):
+        # Ties in the frontiers of the informed searches go to the deepest state
+        return (-self.depth, self.id) < (-other.depth, other.id)
+
+    def measure(self) -> Tuple[int, int, int]:
+        """Returns the number of unresolved cells, the number of rotations
+        left over all cells and the number of unsatisfied connections of the
+        state. They are counted for the first state asked, and every state
+        made after that from a counted one works them out from its parent's."""
+        if self._measure is None:
+            board = self.board
+            self._measure = (board.unresolved_count(), sum(bin(domain).count("1") for domain in board.domain),
+                             board.unsatisfied_count())
+        return self._measure
+
+
+class SolverStats:
+    """Opt-in counters and timers for one solve, filled by a Board (and its
+    PipeMania through InstrumentedPipeMania) when attached as their `stats`.
+    Without it the hooks cost a single `is not None` test."""
+
+    def __init__(self):
+        self.calls = Counter()
+        self.seconds = Counter()
+        self.pruned = Counter()
+        self.passes = []  # (seconds, reductions) of every propagate_constraints pass
+
+    def add(self, phase: str, seconds: float):
+        self.calls[phase] += 1
+        self.seconds[phase] += seconds
+
+    def prune(self, rule: str, before: int, after: int):
+        self.pruned[rule] += bin(before).count("1") - bin(after).count("1")
+
+    def summary(self) -> dict:
+        """Returns the collected figures as a JSON-serializable dict."""
+        return {
+            "phases": {phase: {"calls": self.calls[phase], "seconds": round(self.seconds[phase], 6)}
+                       for phase in sorted(self.calls)},
+            "pruned": dict(sorted(self.pruned.items())),
+            "passes": [{"seconds": round(seconds, 6), "reductions": reductions} for seconds, reductions in self.passes],
+        }
+
+
+class Connectivity:
+    """Incremental disjoint sets over the decided cells of a board, joined
+    along the connections between them. Every set keeps its size and its
+    number of open ends, i.e. connections towards cells not decided yet. A
+    set without open ends is sealed, and unless it covers the whole board
+    no solution can contain it."""
 
-class Board:
-    """Representação interna de um tabuleiro de PipeMania."""
+    def __init__(self, board: 'Board'):
+        self.board = board
+        self.cells = board.rows * board.cols
+        self.parent = array("l", range(self.cells))
+        self.size = array("l", [0]) * self.cells
+        self.open = array("l", [0]) * self.cells
+        self.reason = [0] * self.cells  # per set root, the decision levels explaining it (see Board.reasons)
+        self.history = []  # per fixed cell, the (cell, parent, size, open, reason) entries it overwrote
+        # With exactly cells - 1 connections a connected board is a tree, so no loop may close
+        self.acyclic = sum(OPEN_ENDS[value] for value in board.values) == 2 * (self.cells - 1)
+
+    def is_fixed(self, index: int) -> bool:
+        return self.size[index] != 0
+
+    def find(self, index: int) -> int:
+        parent = self.parent
+        while parent[index] != index:
+            index = parent[index]
+        return index
+
+    def fix(self, index: int, value: int) -> bool:
+        """Adds a decided cell and joins it to the decided neighbours it
+        connects to. Returns False if this seals a set smaller than the board."""
+        parent, size, open_ends, reason = self.parent, self.size, self.open, self.reason
+        board = self.board
+        row, col = divmod(index, board.cols)
+        changes = [(index, parent[index], size[index], open_ends[index], reason[index])]
+        closed_loop = False
+        parent[index] = index
+        size[index] = 1
+        open_ends[index] = OPEN_ENDS[value]
+        reason[index] = board.reasons[index] if board.reasons is not None else 0
+        for direction, (d_row, d_col) in enumerate(DIRECTION_OFFSETS):
+            nei_row, nei_col = row + d_row, col + d_col
+            if not value >> direction & 1 or not (0 <= nei_row < board.rows and 0 <= nei_col < board.cols):
+                continue
+            neighbour = nei_row * board.cols + nei_col
+            if not size[neighbour] or not board.values[neighbour] >> (direction + 2) % 4 & 1:
+                continue
+            root, other = self.find(index), self.find(neighbour)
+            if size[root] < size[other]:
+                root, other = other, root
+            changes.append((root, parent[root], size[root], open_ends[root], reason[root]))
+            if root != other:
+                changes.append((other, parent[other], size[other], open_ends[other], reason[other]))
+                parent[other] = root
+                size[root] += size[other]
+                open_ends[root] += open_ends[other]
+                reason[root] |= reason[other]
+            else:
+                closed_loop = True
+            open_ends[root] -= 2
+        self.history.append(changes)
+        if closed_loop and self.acyclic:
+            return False
+        root = self.find(index)
+        return open_ends[root] != 0 or size[root] == self.cells
+
+    def unfix(self):
+        """Undoes the last call to fix."""
+        parent, size, open_ends, reason = self.parent, self.size, self.open, self.reason
+        for cell, cell_parent, cell_size, cell_open, cell_reason in reversed(self.history.pop()):
+            parent[cell] = cell_parent
+            size[cell] = cell_size
+            open_ends[cell] = cell_open
+            reason[cell] = cell_reason
+
+    def settle(self, mark: int):
+        """Takes the fixes since `history` had `mark` entries for granted:
+        clears the decision levels of every set they changed."""
+        reason = self.reason
+        for changes in self.history[mark:]:
+            for cell, _, _, _, _ in changes:
+                reason[cell] = 0
+
+    def seal_reason(self, index: int, value: int) -> int:
+        """The decision levels behind would_seal(index, value): those of the
+        decided sets the value would join."""
+        board = self.board
+        row, col = divmod(index, board.cols)
+        reason = 0
+        for direction, (d_row, d_col) in enumerate(DIRECTION_OFFSETS):
+            nei_row, nei_col = row + d_row, col + d_col
+            if value >> direction & 1 and 0 <= nei_row < board.rows and 0 <= nei_col < board.cols:
+                neighbour = nei_row * board.cols + nei_col
+                if self.size[neighbour]:
+                    reason |= self.reason[self.find(neighbour)]
+        return reason
+
+    def would_seal(self, index: int, value: int) -> bool:
+        """Whether deciding an undecided cell with `value` would seal a set
+        smaller than the board or, when loops are ruled out, close a loop."""
+        board = self.board
+        row, col = divmod(index, board.cols)
+        roots = []
+        cells, open_ends = 1, 0
+        reaches_undecided = False
+        for direction, (d_row, d_col) in enumerate(DIRECTION_OFFSETS):
+            if not value >> direction & 1:
+                continue
+            nei_row, nei_col = row + d_row, col + d_col
+            if not (0 <= nei_row < board.rows and 0 <= nei_col < board.cols):
+                return False
+            neighbour = nei_row * board.cols + nei_col
+            if not self.size[neighbour]:
+                reaches_undecided = True
+                continue
+            if not board.values[neighbour] >> (direction + 2) % 4 & 1:
+                return False
+            root = self.find(neighbour)
+            if root not in roots:
+                roots.append(root)
+                cells += self.size[root]
+                open_ends += self.open[root]
+            elif self.acyclic:
+                return True
+            open_ends -= 1
+        return not reaches_undecided and open_ends == 0 and cells < self.cells
+
+    def prune_neighbours(self, index: int) -> List[int]:
+        """Removes from the undecided neighbours of a decided cell the values
+        that would seal a set. Returns the cells whose domain shrank."""
+        board = self.board
+        row, col = divmod(index, board.cols)
+        changed = []
+        for d_row, d_col in DIRECTION_OFFSETS:
+            nei_row, nei_col = row + d_row, col + d_col
+            if not (0 <= nei_row < board.rows and 0 <= nei_col < board.cols):
+                continue
+            neighbour = nei_row * board.cols + nei_col
+            if self.size[neighbour]:
+                continue
+            allowed = 0
+            before = board.domain[neighbour]
+            for value in domain_values(before):
+                if not self.would_seal(neighbour, value):
+                    allowed |= 1 << value
+            if board.restrict(neighbour, allowed):
+                changed.append(neighbour)
+                if board.reasons is not None:
+                    for value in domain_values(before & ~allowed):
+                        board.explain(neighbour, self.seal_reason(neighbour, value))
+                if board.stats is not None:
+                    board.stats.prune("connectivity", before, board.domain[neighbour])
+        return changed
 
-    def __init__(self, domain: List[List[List[str]]]):
-        self.domain = domain  # Initialize the domain attribute
 
+class Board:
+    """Representação interna de um tabuleiro de PipeMania.
+
+    `values` holds the current rotation mask of every cell and `domain` the
+    bitset of its remaining rotations, both flat in row-major order."""
 
-    def constraint_domain(self):
+    def __init__(self, values: bytearray, rows: int, cols: int, domain: array = None):
+        self.rows = rows
+        self.cols = cols
+        self.values = values
+        if domain is None:
+            domain = mask_domains(values, [1 << mask for mask in range(16)])
+        self.domain = domain
+        self.reductions = 0
+        self.probes = 0  # rotations tried by probe
+        self.trail = None  # (cell, domain, value) entries to undo, while searching
+        self.queued = None  # per cell, whether it waits in the propagate worklist; all clear between calls
+        self._zobrist = None
+        self._unresolved = None  # goal counters, see unresolved_count and unsatisfied_count
+        self._unsatisfied = None
+        self.connectivity = None
+        self.lifo = False  # revise the most recently changed cells first
+        self.vectorized = False  # run propagate_constraints as whole-board numpy passes
+        self.stats = None  # SolverStats, when instrumented
+        self.version = None  # the PipeManiaState the board was checked out at, while it holds it
+        # Conflict analysis, while backjumping: per cell the decision levels
+        # (one bit each) its domain reductions depend on, the (cell, reason)
+        # entries to undo them, and the levels behind the last failure
+        self.reasons = None
+        self.explained = None
+        self.conflict = 0
+
+    @classmethod
+    def from_grid(cls, grid: List[List[str]]) -> 'Board':
+        """Builds a board from rows of piece codes such as "VB". Raises
+        ValueError on bad input, as parse_bytes."""
+        return cls.parse_bytes("\n".join("\t".join(row) for row in grid).encode())
+
+    def constraint_domain(self) -> bool:
+        """Calculates the domains and propagates them. Returns False if
+        propagation finds the board has no solution or leaves some domain
+        empty."""
         self.calculate_domain()
-        self.propagate_constraints()
-        return self.domain
+        self.connectivity = Connectivity(self)
+        consistent, _ = self.propagate_constraints()
+        return consistent and 0 not in self.domain
 
     def calculate_domain(self):
         """Calculates the domain for each cell based on the initial grid."""
-        domain = []
-
-
-        for row in range(len(self.domain)):
-            domain_row = []
-            for col in range(len(self.domain[row])):
-                piece = self.domain[row][col][0]  # Use the fixed grid
-                piece_type = piece[0]
-                max_row = len(self.domain) - 1
-                max_col = len(self.domain) - 1
-                if row == 0 or col == 0 or row == max_row or col == max_col:
-                    domain_row.append(self.fix_board_edges(row, col, max_row, max_col))
-                else:
-                    domain_row.append(self.get_possible_rotations(piece_type))
-            domain.append(domain_row)
-        self.domain = domain
+        start = time.perf_counter() if self.stats is not None else 0.0
+        self.domain = mask_domains(self.values, MASK_ROTATIONS)
+        self._unresolved = self._unsatisfied = None
+
+        max_row = self.rows - 1
+        max_col = self.cols - 1
+        for row in range(self.rows):
+            cols = range(self.cols) if row == 0 or row == max_row else (0, max_col)
+            for col in cols:
+                self.set_domain(row * self.cols + col, self.fix_board_edges(row, col, max_row, max_col))
+        if self.stats is not None:
+            self.stats.add("calculate_domain", time.perf_counter() - start)
 
 
     def fix_board_edges(self, row, col, max_row, max_col):
         """Fixes the rotations of the pieces on the edges of the board."""
+        outside = 0
+        if row == 0:
+            outside |= UP
+        if col == 0:
+            outside |= LEFT
+        if row == max_row:
+            outside |= DOWN
+        if col == max_col:
+            outside |= RIGHT
+
+        piece_type = MASK_PIECES[self.values[row * self.cols + col]][0]
+        return self.get_possible_rotations(piece_type) & CLOSED_ROTATIONS[outside]
+
+
+    def propagate_constraints(self) -> Tuple[bool, bool]:
+        """Propagates the constraints of every cell until a fixpoint is reached.
+        Returns whether the board may still have a solution (False once it
+        turned out to have none) and whether any domain shrank."""
+        reductions = self.reductions
+        start = time.perf_counter() if self.stats is not None else 0.0
+        if not self.vectorized:
+            consistent = self.propagate(range(self.rows * self.cols))
+        else:
+            consistent = self.propagate_vectorized()
+            if consistent and self.connectivity is not None:
+                domain = self.domain
+                consistent = self.propagate([index for index in range(len(domain))
+                                             if domain[index] & (domain[index] - 1) == 0])
+        if self.stats is not None:
+            seconds = time.perf_counter() - start
+            self.stats.add("propagate_constraints", seconds)
+            self.stats.passes.append((seconds, self.reductions - reductions))
+        return consistent, self.reductions != reductions
+
+    def probe(self, max_probes: int = None, seconds: float = None) -> bool:
+        """Failed-literal probing, towards singleton arc consistency: every
+        rotation of an undecided cell is tried, propagated and undone, and a
+        rotation whose propagation wipes out some domain is ruled out for
+        good. Cells with fewer rotations are probed first, and passes repeat
+        over the cells around those that changed in the last one, until
+        `max_probes` probes are made or `seconds` go by. The tentative
+        changes go to a trail of their own, and the removals that stay are
+        then moved to the board trail, if there is one, so that an undo there
+        restores them too. Returns False if the board has no solution."""
+        start = time.perf_counter()
+        deadline = start + seconds if seconds is not None else None
+        rows, cols = self.rows, self.cols
+        domain = self.domain
+        trail, self.trail = self.trail, []
+        stats, self.stats = self.stats, None  # the tentative propagations are not counted
+        try:
+            cells = range(len(domain))
+            while cells:
+                cells = [index for index in cells if domain[index] & (domain[index] - 1)]
+                cells.sort(key=lambda index: bin(domain[index]).count("1"))
+                if trail is not None:
+                    trail.extend(self.trail)
+                del self.trail[:]
+                for index in cells:
+                    for value in domain_values(domain[index]):
+                        if not domain[index] >> value & 1:
+                            continue
+                        if max_probes is not None and self.probes >= max_probes or \
+                                deadline is not None and time.perf_counter() >= deadline:
+                            return True
+                        self.probes += 1
+                        mark, reductions = len(self.trail), self.reductions
+                        self.restrict(index, 1 << value)
+                        consistent = self.propagate((index,))
+                        self.undo(mark)
+                        self.reductions = reductions
+                        if consistent:
+                            continue
+                        if stats is not None:
+                            stats.prune("probing", domain[index], domain[index] & ~(1 << value))
+                        self.restrict(index, ~(1 << value))
+                        if not domain[index] or not self.propagate((index,)):
+                            return False
+                changed = set()
+                for index, old_domain, _ in self.trail:
+                    if old_domain is not None:
+                        row, col = divmod(index, cols)
+                        changed.add(index)
+                        for d_row, d_col in DIRECTION_OFFSETS:
+                            if 0 <= row + d_row < rows and 0 <= col + d_col < cols:
+                                changed.add((row + d_row) * cols + col + d_col)
+                cells = sorted(changed)
+            return True
+        finally:
+            if trail is not None:
+                trail.extend(self.trail)
+            self.trail = trail
+            self.stats = stats
+            if stats is not None:
+                stats.add("probe", time.perf_counter() - start)
+
+    def propagate_vectorized(self) -> bool:
+        """Local propagation of the whole board with numpy. The first pass
+        prunes every cell at once against its four shifted neighbour grids;
+        later passes only revise the neighbours of the cells the previous pass
+        changed, until nothing changes. Connectivity is left to propagate.
+        Returns False if some domain is wiped out."""
+        import numpy as np
+        up, right, down, left = supported_tables()
+        rows, cols = self.rows, self.cols
+        width = cols + 2
+        grid = np.full((rows + 2, width), 0xFFFF, dtype=np.uint16)
+        old = np.frombuffer(self.domain, dtype=np.uint16).reshape(rows, cols)
+        inside = grid[1:-1, 1:-1]
+        inside[...] = old
+        inside &= down[grid[:-2, 1:-1]]
+        inside &= up[grid[2:, 1:-1]]
+        inside &= right[grid[1:-1, :-2]]
+        inside &= left[grid[1:-1, 2:]]
+
+        # Flat indices into the padded grid from here on
+        domain = grid.ravel()
+        on_board = np.zeros((rows + 2, width), dtype=bool)
+        on_board[1:-1, 1:-1] = True
+        on_board = on_board.ravel()
+        pending = np.zeros_like(on_board)
+        changed = np.flatnonzero(grid != np.pad(old, 1, constant_values=0xFFFF))
+        while changed.size:
+            for offset in (-width, 1, width, -1):
+                pending[changed + offset] = True
+            pending &= on_board
+            cells = np.flatnonzero(pending)
+            pending[cells] = False
+            current = domain[cells]
+            pruned = (current & down[domain[cells - width]] & up[domain[cells + width]]
+                      & right[domain[cells - 1]] & left[domain[cells + 1]])
+            shrank = pruned != current
+            changed = cells[shrank]
+            domain[changed] = pruned[shrank]
+        self.write_domains(inside)
+        return bool(inside.all())
+
+    def write_domains(self, domains):
+        """Replaces every domain with a numpy grid of new ones, moving the
+        rotations that fell outside. Goes through set_domain while a trail or
+        hash has to follow the changes, and in bulk otherwise."""
+        import numpy as np
+        old = np.frombuffer(self.domain, dtype=np.uint16).reshape(domains.shape)
+        changed = np.flatnonzero(domains != old)
+        self.reductions += changed.size
+        if self.trail is not None or self._zobrist is not None or self._unresolved is not None:
+            for index in changed.tolist():
+                self.set_domain(index, int(domains.flat[index]))
+            return
+        old[...] = domains
+        values = np.frombuffer(self.values, dtype=np.uint8)
+        domain = old.ravel()[changed]
+        moved = changed[(domain >> values[changed] & 1 == 0) & (domain != 0)]
+        lowest = old.ravel()[moved] & -old.ravel()[moved]
+        values[moved] = np.log2(lowest).astype(np.uint8)
+
+    def propagate(self, cells) -> bool:
+        """Worklist propagation starting from `cells`: only the neighbours of a
+        cell whose domain actually shrank are revised again. Returns False as
+        soon as some domain is wiped out."""
+        cols = self.cols
+        domain = self.domain
+        queue = deque(cells)
+        queued = self.queued
+        if queued is None:
+            queued = self.queued = bytearray(self.rows * cols)
+        for index in queue:
+            queued[index] = 1
+
+        try:
+            while queue:
+                index = queue.pop() if self.lifo else queue.popleft()
+                queued[index] = 0
+                changed_cells = self.propagate_algorithm(*divmod(index, cols))
+                if self.connectivity is not None and domain[index] & (domain[index] - 1) == 0 \
+                        and not self.connectivity.is_fixed(index):
+                    if not self.fix(index):
+                        if self.reasons is not None:
+                            self.conflict = self.connectivity.reason[self.connectivity.find(index)]
+                        return False
+                    changed_cells += self.connectivity.prune_neighbours(index)
+                for changed in changed_cells:
+                    if domain[changed] == 0:
+                        if self.reasons is not None:
+                            self.conflict = self.reasons[changed]
+                        return False
+                    if not queued[changed]:
+                        queued[changed] = 1
+                        queue.append(changed)
+            return True
+        finally:
+            for index in queue:  # left behind by a wipe-out
+                queued[index] = 0
 
-        possible_rotations = []
-        piece = self.domain[row][col][0]
-        piece_type = piece[0]
-
-        if piece_type == "F":
-            if row == 0:
-                possible_rotations = ["FD", "FE", "FB"]
-            if col == 0:
-                possible_rotations = ["FC", "FD", "FB"]
-            if row == max_row:
-                possible_rotations = ["FC", "FE", "FD"]
-            if col == max_col:
-                possible_rotations = ["FC", "FB", "FE"]
-            if row == 0 and col == 0:
-                possible_rotations = ["FD", "FB"]
-            if row == max_row and col == 0:
-                possible_rotations = ["FC", "FD"]
-            if row == max_row and col == max_col:
-                possible_rotations = ["FC", "FE"]
-            if row == 0 and col == max_col:
-                possible_rotations = ["FB", "FE"]
-        elif piece_type == "B":
-            if row == 0:
-                possible_rotations = ["BB"]
-            if col == 0:
-                possible_rotations = ["BD"]
-            if row == max_row:
-                possible_rotations = ["BC"]
-            if col == max_col:
-                possible_rotations = ["BE"]
-        elif piece_type == "V":
-            if row == 0:
-                possible_rotations = ["VB", "VE"]
-            if col == 0:
-                possible_rotations = ["VB", "VD"]
-            if row == max_row:
-                possible_rotations = ["VC", "VD"]
-            if col == max_col:
-                possible_rotations = ["VE", "VC"]
-            if row == 0 and col == 0:
-                possible_rotations = ["VB"]
-            if row == max_row and col == 0:
-                possible_rotations = ["VD"]
-            if row == max_row and col == max_col:
-                possible_rotations = ["VC"]
-            if row == 0 and col == max_col:
-                possible_rotations = ["VE"]
-        elif piece_type == "L":
-            if row == 0:
-                possible_rotations = ["LH"]
-            if col == 0:
-                possible_rotations = ["LV"]
-            if row == max_row:
-                possible_rotations = ["LH"]
-            if col == max_col:
-                possible_rotations = ["LV"]
-
-            # Update the piece with the fixed rotations
-        return possible_rotations
-
-
-    def propagate_constraints(self):
-        rows = len(self.domain)
-        cols = len(self.domain[0])
-
-        layers = min(rows, cols) // 2
-
-        for layer in range(layers):
-            for pipe1 in range(layer, cols - layer):
-                self.propagate_algorithm(layer, pipe1)
-
-            for pipe1 in range(layer + 1, rows - layer):
-                self.propagate_algorithm(pipe1, cols - layer - 1)
-
-            for pipe1 in range(cols - layer - 2, layer - 1, -1):
-                self.propagate_algorithm(rows - layer - 1, pipe1)
-
-            for pipe1 in range(rows - layer - 2, layer, -1):
-                self.propagate_algorithm(pipe1, layer)
-
+    def fix(self, index: int) -> bool:
+        """Records a decided cell in the connectivity tracker. Returns False if
+        the cell seals a group of pipes that does not cover the whole board."""
+        if self.trail is not None:
+            self.trail.append((index, None, None))
+        return self.connectivity.fix(index, self.values[index])
 
 
-    def check_compatibility_pair(self, first_piece: str, first_row: int, first_col: int, second_piece: str, second_row: int, second_col: int):
+    def check_compatibility_pair(self, first_piece: int, first_row: int, first_col: int, second_piece: int, second_row: int, second_col: int):
         """Based on a pair of pieces determines if they are compatible between each other"""
-        if first_row == second_row:
-            if first_col < second_col:
-                if self.is_piece_right_oriented(first_piece) and self.is_piece_left_oriented(second_piece):
-                    return True
-            elif first_col > second_col:
-                if self.is_piece_right_oriented(second_piece) and self.is_piece_left_oriented(first_piece):
-                    return True
-        elif first_col == second_col:
-            if first_row < second_row:
-                if self.is_piece_down_oriented(first_piece) and  self.is_piece_up_oriented(second_piece):
-                    return True
-            elif first_row > second_row:
-                if self.is_piece_down_oriented(second_piece) and self.is_piece_up_oriented(first_piece):
-                    return True
-        return False
+        return check_compatibility_pair(first_piece, first_row, first_col, second_piece, second_row, second_col)
 
-    def is_piece_left_oriented(self, input_piece: str) -> bool:
+    def is_piece_left_oriented(self, input_piece: int) -> bool:
         """Check if piece is left oriented(continues a pipe that comes from left)"""
-        if input_piece.startswith("L"):
-            if input_piece[1] == "H":
-                return True
-        elif input_piece.startswith("V"):
-            if input_piece[1] == "E" or input_piece[1] == "C":
-                return True
-        elif input_piece.startswith("B"):
-            if input_piece[1] != "D":
-                return True
-        elif input_piece.startswith("F"):
-            if input_piece[1] == "E":
-                return True
-        return False
+        return bool(input_piece & LEFT)
 
 
-    def is_piece_right_oriented(self, input_piece: str) -> bool:
+    def is_piece_right_oriented(self, input_piece: int) -> bool:
         """Check if piece is right oriented(continues a pipe that comes from right)"""
-        if input_piece.startswith("L"):
-            if input_piece[1] == "H":
-                return True
-        elif input_piece.startswith("V"):
-            if input_piece[1] == "B" or input_piece[1] == "D":
-                return True
-        elif input_piece.startswith("B"):
-            if input_piece[1] != "E":
-                return True
-        elif input_piece.startswith("F"):
-            if input_piece[1] == "D":
-                return True
-        return False
+        return bool(input_piece & RIGHT)
 
-    def is_piece_up_oriented(self, input_piece: str) -> bool:
+    def is_piece_up_oriented(self, input_piece: int) -> bool:
         """Check if piece is up oriented(continues a pipe that comes from above)"""
-        if input_piece.startswith("L"):
-            if input_piece[1] == "V":
-                return True
-        elif input_piece.startswith("V"):
-            if input_piece[1] == "C" or input_piece[1] == "D":
-                return True
-        elif input_piece.startswith("B"):
-            if input_piece[1] != "B":
-                return True
-        elif input_piece.startswith("F"):
-            if input_piece[1] == "C":
-                return True
-        return False
+        return bool(input_piece & UP)
 
-    def is_piece_down_oriented(self, input_piece: str) -> bool:
+    def is_piece_down_oriented(self, input_piece: int) -> bool:
         """Check if piece is down oriented(continues a pipe that comes from below)"""
-        if input_piece.startswith("L"):
-            if input_piece[1] == "V":
-                return True
-        elif input_piece.startswith("V"):
-            if input_piece[1] == "B" or input_piece[1] == "E":
-                return True
-        elif input_piece.startswith("B"):
-            if input_piece[1] != "C":
-                return True
-        elif input_piece.startswith("F"):
-            if input_piece[1] == "B":
-                return True
-        return False
+        return bool(input_piece & DOWN)
 
 
-    def get_possible_rotations(self, piece_type: str) -> List[str]:
-        """Returns the possible rotations for a given piece type."""
-        if piece_type == "F":
-            return ["FC", "FD", "FE", "FB"]
-        elif piece_type == "B":
-            return ["BC", "BB", "BE", "BD"]
-        elif piece_type == "V":
-            return ["VC", "VB", "VE", "VD"]
-        elif piece_type == "L":
-            return ["LH", "LV"]
-        else:
-            return []
+    def get_possible_rotations(self, piece_type: str) -> int:
+        """Returns the domain with every rotation of a given piece type."""
+        return PIECE_ROTATIONS.get(piece_type, 0)
 
-    def get_value(self, row: int, col: int) -> str:
+    def get_value(self, row: int, col: int) -> int:
         """Devolve o valor na respetiva posição do tabuleiro."""
-        return self.domain[row][col][0]
+        return self.values[row * self.cols + col]
 
-    def adjacent_vertical_values(self, row: int, col: int) -> Tuple[str, str]:
+    def adjacent_vertical_values(self, row: int, col: int) -> Tuple[int, int]:
         """Devolve os valores imediatamente acima e abaixo, respectivamente."""
-        above_value = self.domain[row - 1][col][0] if row > 0 else None
-        below_value = self.domain[row + 1][col][0] if row < len(self.domain) - 1 else None
+        above_value = self.get_value(row - 1, col) if row > 0 else None
+        below_value = self.get_value(row + 1, col) if row < self.rows - 1 else None
         return above_value, below_value
 
-    def adjacent_horizontal_values(self, row: int, col: int) -> Tuple[str, str]:
+    def adjacent_horizontal_values(self, row: int, col: int) -> Tuple[int, int]:
         """Devolve os valores imediatamente à esquerda e à direita, respectivamente."""
-        left_value = self.domain[row][col - 1][0] if col > 0 else None
-        right_value = self.domain[row][col + 1][0] if col < len(self.domain[row]) - 1 else None
+        left_value = self.get_value(row, col - 1) if col > 0 else None
+        right_value = self.get_value(row, col + 1) if col < self.cols - 1 else None
         return left_value, right_value
 
     def is_optimal(self, row: int, col: int) -> bool:
         """Vê se uma peça já é optimal, ou seja, se não tem mais nenhuma possivel rotação"""
-        if len(self.domain[row][col]) == 1:
-            return True
-        else:
+        domain = self.domain[row * self.cols + col]
+        return domain != 0 and domain & (domain - 1) == 0
+
+    def set_domain(self, index: int, domain: int):
+        """Replaces the domain of a cell, keeping its current rotation inside it."""
+        old_domain, old_value = self.domain[index], self.values[index]
+        if self.trail is not None:
+            self.trail.append((index, old_domain, old_value))
+        self.domain[index] = domain
+        if domain and not domain >> old_value & 1:
+            self.values[index] = first_value(domain)
+        if self._zobrist is not None:
+            self.update_zobrist(index, old_value, old_domain)
+        if self._unresolved is not None:
+            self.update_counts(index, old_value, old_domain)
+
+    def zobrist_hash(self) -> int:
+        """Returns the Zobrist fingerprint of the current rotations and domains,
+        computed on first use and then kept up to date cell by cell."""
+        if self._zobrist is None:
+            fingerprint = 0
+            for index, (value, domain) in enumerate(zip(self.values, self.domain)):
+                fingerprint ^= zobrist_key(index, value, domain)
+            self._zobrist = fingerprint
+        return self._zobrist
+
+    def update_zobrist(self, index: int, old_value: int, old_domain: int):
+        """Swaps the old key of a cell for the key of its current contents."""
+        self._zobrist ^= zobrist_key(index, old_value, old_domain) ^ zobrist_key(index, self.values[index], self.domain[index])
+
+    def unresolved_count(self) -> int:
+        """Returns the number of cells left with more than one rotation, or
+        none. Counted on first use, like the Zobrist fingerprint, and then
+        kept up to date cell by cell."""
+        if self._unresolved is None:
+            self.count_goal()
+        return self._unresolved
+
+    def unsatisfied_count(self) -> int:
+        """Returns the number of connections of the current rotations open on
+        one side only, or open towards the border, kept like unresolved_count."""
+        if self._unsatisfied is None:
+            self.count_goal()
+        return self._unsatisfied
+
+    def count_goal(self):
+        """Counts the unresolved cells and unsatisfied connections of the whole board."""
+        rows, cols, values = self.rows, self.cols, self.values
+        self._unresolved = sum(1 for domain in self.domain if domain & (domain - 1) or not domain)
+        unsatisfied = 0
+        for index, value in enumerate(values):
+            row, col = divmod(index, cols)
+            # Each connection is counted from the cell above it or on its left,
+            # and from the cell itself on the top and left borders
+            right = values[index + 1] & LEFT if col + 1 < cols else 0
+            below = values[index + cols] & UP if row + 1 < rows else 0
+            unsatisfied += (value & RIGHT != 0) != (right != 0)
+            unsatisfied += (value & DOWN != 0) != (below != 0)
+            if row == 0:
+                unsatisfied += value & UP != 0
+            if col == 0:
+                unsatisfied += value & LEFT != 0
+        self._unsatisfied = unsatisfied
+
+    def mismatches(self, index: int, value: int) -> int:
+        """Number of the connections around a cell, if it had rotation
+        `value`, that are open on one side only or open towards the border."""
+        rows, cols, values = self.rows, self.cols, self.values
+        row, col = divmod(index, cols)
+        count = 0
+        for direction, (d_row, d_col) in enumerate(DIRECTION_OFFSETS):
+            nei_row, nei_col = row + d_row, col + d_col
+            if 0 <= nei_row < rows and 0 <= nei_col < cols:
+                count += value >> direction & 1 != values[nei_row * cols + nei_col] >> (direction + 2) % 4 & 1
+            else:
+                count += value >> direction & 1
+        return count
+
+    def update_counts(self, index: int, old_value: int, old_domain: int):
+        """Keeps the goal counters up to date after a cell's domain or rotation changed."""
+        domain = self.domain[index]
+        self._unresolved += (domain & (domain - 1) != 0 or domain == 0) - (old_domain & (old_domain - 1) != 0 or old_domain == 0)
+        value = self.values[index]
+        if value != old_value:
+            self._unsatisfied += self.mismatches(index, value) - self.mismatches(index, old_value)
+
+    def undo(self, mark: int):
+        """Restores every domain and decided cell changed since the trail had
+        `mark` entries."""
+        trail = self.trail
+        while len(trail) > mark:
+            index, domain, value = trail.pop()
+            if domain is None:
+                self.connectivity.unfix()
+                continue
+            self.assign(index, domain, value)
+
+    def explain(self, index: int, reason: int):
+        """Adds decision levels to those a cell's domain reductions depend on."""
+        old = self.reasons[index]
+        if old | reason != old:
+            self.explained.append((index, old))
+            self.reasons[index] = old | reason
+
+    def unexplain(self, mark: int):
+        """Restores the explanations changed since `explained` had `mark` entries."""
+        explained = self.explained
+        while len(explained) > mark:
+            index, reason = explained.pop()
+            self.reasons[index] = reason
+
+    def assign(self, index: int, domain: int, value: int):
+        """Puts back a domain and rotation, bypassing the trail."""
+        old_domain, old_value = self.domain[index], self.values[index]
+        self.domain[index] = domain
+        self.values[index] = value
+        if self._zobrist is not None:
+            self.update_zobrist(index, old_value, old_domain)
+        if self._unresolved is not None:
+            self.update_counts(index, old_value, old_domain)
+
+    def checkout(self, state: 'PipeManiaState'):
+        """Moves the board to the rotations and domains of `state`, unless it
+        holds them already, and rebuilds the connectivity of its decided
+        cells. The goal counters and hash are counted again on next use."""
+        if self.version is state:
+            return
+        self.values[:] = b"".join(state.values)
+        domain = array("H")
+        domain.frombytes(b"".join(state.domain))
+        self.domain[:] = domain
+        self._zobrist = self._unresolved = self._unsatisfied = None
+        self.connectivity = Connectivity(self)
+        for index, domain in enumerate(self.domain):
+            if domain and not domain & (domain - 1):
+                self.connectivity.fix(index, self.values[index])
+        self.version = state
+
+    def restrict(self, index: int, allowed: int) -> bool:
+        """Keeps only the `allowed` values in a cell's domain, returning whether it shrank."""
+        domain = self.domain[index]
+        if domain & allowed == domain:
             return False
+        self.set_domain(index, domain & allowed)
+        self.reductions += 1
+        return True
 
-    def get_neighbours(self, row: int, col: int, piece_type: str) -> list:
+    def get_neighbours(self, row: int, col: int, piece_type: int) -> list:
         neighbours_list = []
-        if self.is_piece_right_oriented(piece_type):
+        if piece_type & RIGHT:
             neighbours_list.append((row, col + 1))
-        if self.is_piece_left_oriented(piece_type):
+        if piece_type & LEFT:
             neighbours_list.append((row, col - 1))
-        if self.is_piece_down_oriented(piece_type):
+        if piece_type & DOWN:
             neighbours_list.append((row + 1, col))
-        if self.is_piece_up_oriented(piece_type):
+        if piece_type & UP:
             neighbours_list.append((row - 1, col))
 
         return neighbours_list
 
-    def get_not_neighbours(self, row: int, col: int, piece_type: str) -> list:
+    def get_not_neighbours(self, row: int, col: int, piece_type: int) -> list:
         not_neighbours_list = []
-        if not self.is_piece_right_oriented(piece_type) and col != len(self.domain[row]) - 1:
+        if not piece_type & RIGHT and col != self.cols - 1:
             not_neighbours_list.append((row, col + 1))
-        if not self.is_piece_left_oriented(piece_type) and col != 0:
+        if not piece_type & LEFT and col != 0:
             not_neighbours_list.append((row, col - 1))
-        if not self.is_piece_down_oriented(piece_type) and row != len(self.domain[row]) - 1:
+        if not piece_type & DOWN and row != self.rows - 1:
             not_neighbours_list.append((row + 1, col))
-        if not self.is_piece_up_oriented(piece_type) and row != 0:
+        if not piece_type & UP and row != 0:
             not_neighbours_list.append((row - 1, col))
 
         return not_neighbours_list
 
-    def neighbour_points_towards(self, nei_row: int, nei_col: int, nei_piece_type: str, opt_row: int, opt_col: int ):
+    def neighbour_points_towards(self, nei_row: int, nei_col: int, nei_piece_type: int, opt_row: int, opt_col: int ):
         if nei_row > opt_row:
-            if self.is_piece_up_oriented(nei_piece_type):
-                return True
-            else:
-                return False
+            return bool(nei_piece_type & UP)
         if nei_row < opt_row:
-            if self.is_piece_down_oriented(nei_piece_type):
-                return True
-            else:
-                return False
+            return bool(nei_piece_type & DOWN)
         if nei_col > opt_col:
-            if self.is_piece_left_oriented(nei_piece_type):
-                return True
-            else:
-                return False
+            return bool(nei_piece_type & LEFT)
         if nei_col < opt_col:
-            if self.is_piece_right_oriented(nei_piece_type):
-                return True
-            else:
-                return False
-    def needs_connection(self, row: int, col: int) -> list:
-        needs_connection_directions = []
-        needs_connection = False
-
-        for i in self.domain[row][col]:
-            if self.is_piece_right_oriented(i):
-                needs_connection = True
-            else:
-                needs_connection = False
-                break
-        if needs_connection:
-            needs_connection_directions.append("right")
-
-        for j in self.domain[row][col]:
-            if self.is_piece_left_oriented(j):
-                needs_connection = True
-            else:
-                needs_connection = False
-                break
-        if needs_connection:
-            needs_connection_directions.append("left")
-
-        for n in self.domain[row][col]:
-            if self.is_piece_up_oriented(n):
-                needs_connection = True
-            else:
-                needs_connection = False
-                break
-        if needs_connection:
-            needs_connection_directions.append("up")
-
-        for l in self.domain[row][col]:
-            if self.is_piece_down_oriented(l):
-                needs_connection = True
-            else:
-                needs_connection = False
-                break
-
-        if needs_connection:
-            needs_connection_directions.append("down")
+            return bool(nei_piece_type & RIGHT)
+        return False
 
+    def needs_connection(self, row: int, col: int) -> int:
+        """Returns the sides every remaining rotation of the cell opens to."""
+        needs_connection_directions = UP | RIGHT | DOWN | LEFT
+        for val in domain_values(self.domain[row * self.cols + col]):
+            needs_connection_directions &= val
         return needs_connection_directions
 
-    def get_neighbour_in_directions(self, row: int, col: int, direction: str) -> list:
-        if direction == "left":
-            return [row, col - 1]
-        if direction == "right":
-            return [row, col + 1]
-        if direction == "down":
-            return [row + 1, col]
-        if direction == "up":
-            return [row - 1, col]
-
-
-    def print_board(self):
+    def get_neighbour_in_directions(self, row: int, col: int, direction: int) -> Tuple[int, int]:
+        if direction == LEFT:
+            return row, col - 1
+        if direction == RIGHT:
+            return row, col + 1
+        if direction == DOWN:
+            return row + 1, col
+        if direction == UP:
+            return row - 1, col
+
+
+    def to_cnf(self) -> Tuple[dict, List[List[int]]]:
+        """Encodes the current domains as CNF: one variable per rotation of
+        every undecided cell, exactly one of them true per cell, and for every
+        such rotation a clause that each undecided neighbour takes a rotation
+        compatible with it. Decided cells are constants, and a cell with no
+        rotation left is an empty clause. Connectivity is not encoded. Returns
+        the variable of every (cell, rotation) and the clauses as lists of
+        DIMACS literals."""
+        domain, cols = self.domain, self.cols
+        variables = {}
+        clauses = []
+        for index, cell_domain in enumerate(domain):
+            if cell_domain & (cell_domain - 1):
+                literals = []
+                for value in domain_values(cell_domain):
+                    variables[index, value] = len(variables) + 1
+                    literals.append(len(variables))
+                clauses.append(literals)
+                clauses.extend([-first, -second] for first, second in itertools.combinations(literals, 2))
+            elif not cell_domain:
+                clauses.append([])
+        for (index, value), variable in variables.items():
+            row, col = divmod(index, cols)
+            for direction, (d_row, d_col) in enumerate(DIRECTION_OFFSETS):
+                nei_row, nei_col = row + d_row, col + d_col
+                if not (0 <= nei_row < self.rows and 0 <= nei_col < cols):
+                    if value >> direction & 1:
+                        clauses.append([-variable])
+                    continue
+                neighbour = nei_row * cols + nei_col
+                supported = SUPPORT[direction][value] & domain[neighbour]
+                if domain[neighbour] & (domain[neighbour] - 1):
+                    clauses.append([-variable] + [variables[neighbour, other] for other in domain_values(supported)])
+                elif not supported:
+                    clauses.append([-variable])
+        return variables, clauses
+
+    def label_components(self, values: bytearray = None) -> Tuple[array, List[int], List[int], int]:
+        """Labels the cells with the set they are joined to by the connections
+        of their current rotations (or of `values`), following only
+        connections open on both sides, in one pass with an explicit stack.
+        Returns the label of every cell, the size and the number of open
+        ends (connections towards the border or towards a cell that does not
+        connect back) of every set, and the label of the largest set, or -1
+        on an empty board."""
+        values = self.values if values is None else values
+        cols, cells = self.cols, self.rows * self.cols
+        labels = array("l", [-1]) * cells
+        sizes, open_ends = [], []
+        # (side, offset to the neighbour, its side facing back) per direction
+        sides = ((UP, -cols, DOWN), (RIGHT, 1, LEFT), (DOWN, cols, UP), (LEFT, -1, RIGHT))
+        for first in range(cells):
+            if labels[first] != -1:
+                continue
+            label = len(sizes)
+            labels[first] = label
+            stack = [first]
+            size = ends = 0
+            while stack:
+                index = stack.pop()
+                size += 1
+                value = values[index]
+                col = index % cols
+                for side, offset, back in sides:
+                    if not value & side:
+                        continue
+                    neighbour = index + offset
+                    if side == UP and index < cols or side == DOWN and neighbour >= cells or \
+                            side == RIGHT and col == cols - 1 or side == LEFT and col == 0 or \
+                            not values[neighbour] & back:
+                        ends += 1
+                    elif labels[neighbour] == -1:
+                        labels[neighbour] = label
+                        stack.append(neighbour)
+            sizes.append(size)
+            open_ends.append(ends)
+        largest = max(range(len(sizes)), key=sizes.__getitem__, default=-1)
+        return labels, sizes, open_ends, largest
+
+    def components(self, values: bytearray = None) -> List[List[int]]:
+        """Groups the cells into the sets of label_components."""
+        labels, sizes, _, _ = self.label_components(values)
+        components = [[] for _ in sizes]
+        for index, label in enumerate(labels):
+            components[label].append(index)
+        return components
+
+    def regions(self) -> List[List[int]]:
+        """Groups the undecided cells into the sets joined by adjacency. The
+        decided cells separate them: propagation only ever revises the
+        neighbours of a cell, so choices in one region can only meet those in
+        another through the connectivity of the pipes."""
+        rows, cols = self.rows, self.cols
+        domain = self.domain
+        seen = bytearray(rows * cols)
+        regions = []
+        for first in range(rows * cols):
+            if seen[first] or not domain[first] & (domain[first] - 1):
+                continue
+            seen[first] = 1
+            region = [first]
+            for index in region:
+                row, col = divmod(index, cols)
+                for d_row, d_col in DIRECTION_OFFSETS:
+                    nei_row, nei_col = row + d_row, col + d_col
+                    if 0 <= nei_row < rows and 0 <= nei_col < cols:
+                        neighbour = nei_row * cols + nei_col
+                        if not seen[neighbour] and domain[neighbour] & (domain[neighbour] - 1):
+                            seen[neighbour] = 1
+                            region.append(neighbour)
+            regions.append(region)
+        return regions
+
+    def cut_clause(self, component: List[int], variables: dict) -> List[int]:
+        """The clause of to_cnf variables saying that some connection out of
+        a set of cells opens, from either side."""
+        cols = self.cols
+        inside = set(component)
+        clause = set()
+        for index in component:
+            row, col = divmod(index, cols)
+            for direction, (d_row, d_col) in enumerate(DIRECTION_OFFSETS):
+                nei_row, nei_col = row + d_row, col + d_col
+                neighbour = nei_row * cols + nei_col
+                if not (0 <= nei_row < self.rows and 0 <= nei_col < cols) or neighbour in inside:
+                    continue
+                for value in range(16):
+                    if value >> direction & 1 and (index, value) in variables:
+                        clause.add(variables[index, value])
+                    if value >> (direction + 2) % 4 & 1 and (neighbour, value) in variables:
+                        clause.add(variables[neighbour, value])
+        return sorted(clause)
+
+    def violation(self) -> str:
+        """Checks the current rotations as a solution with verify.py. Returns
+        the first violation found, or None if they solve the board."""
+        from verify import first_violation
+        cols = self.cols
+        return first_violation(self.values[row * cols:(row + 1) * cols] for row in range(self.rows))
+
+    def to_grid(self) -> List[List[str]]:
+        """Returns the rows of piece codes of the current rotations."""
+        cols = self.cols
+        return [[MASK_PIECES[value] for value in self.values[row * cols:(row + 1) * cols]] for row in range(self.rows)]
+
+    def print_board(self, file=None):
         """Prints the board grid."""
-        for row in self.domain:
-            print('\t'.join(cell[0] for cell in row))
-
-
-    def propagate_algorithm(self, row: int, col: int):
-        needs_connection = self.needs_connection(row, col)
-        temp_domain_pipe1 = []
-        for pipe1 in self.domain[row][col]:
-            if len(temp_domain_pipe1) != 0 and pipe1 not in temp_domain_pipe1:
+        cols = self.cols
+        for row in range(self.rows):
+            print('\t'.join(MASK_PIECES[value] for value in self.values[row * cols:(row + 1) * cols]), file=file)
+
+
+    def propagate_algorithm(self, row: int, col: int) -> List[int]:
+        """Prunes the cell and its neighbours down to the values that are
+        supported on both sides of every edge they share. Returns the cells
+        whose domain shrank."""
+        index = row * self.cols + col
+        domain = self.domain
+        stats = self.stats
+        start = time.perf_counter() if stats is not None else 0.0
+        changed = []
+        for direction, (d_row, d_col) in enumerate(DIRECTION_OFFSETS):
+            nei_row, nei_col = row + d_row, col + d_col
+            if not (0 <= nei_row < self.rows and 0 <= nei_col < self.cols):
                 continue
-            neighbours = self.get_neighbours(row, col, pipe1)
-            if self.is_optimal(row, col):
-                for neighbour in neighbours:
-                    temp_domain = self.domain[neighbour[0]][neighbour[1]].copy()
-                    for val in self.domain[neighbour[0]][neighbour[1]]:
-                        if not self.check_compatibility_pair(val, neighbour[0], neighbour[1], pipe1, row, col):
-                            temp_domain.remove(val)
-                    if len(temp_domain) != len(self.domain[neighbour[0]][neighbour[1]]):
-                        self.domain[neighbour[0]][neighbour[1]] = temp_domain
-                not_neighbours = self.get_not_neighbours(row, col, pipe1)
-                for not_neighbour in not_neighbours:
-                    temp_domain = self.domain[not_neighbour[0]][not_neighbour[1]].copy()
-                    for val in self.domain[not_neighbour[0]][not_neighbour[1]]:
-                        if self.neighbour_points_towards(not_neighbour[0], not_neighbour[1], val, row, col):
-                            temp_domain.remove(val)
-                    if len(temp_domain) != len(self.domain[not_neighbour[0]][not_neighbour[1]]):
-                        self.domain[not_neighbour[0]][not_neighbour[1]] = temp_domain
-            else:
-                if len(needs_connection) != 0:
-                    for direction in needs_connection:
-                        dir_neighbours = self.get_neighbour_in_directions(row, col, direction)
-                        temp_domain = self.domain[dir_neighbours[0]][dir_neighbours[1]].copy()
-                        for val in self.domain[dir_neighbours[0]][dir_neighbours[1]]:
-                            if not self.check_compatibility_pair(val, dir_neighbours[0], dir_neighbours[1], pipe1, row, col):
-                                temp_domain.remove(val)
-                        if len(temp_domain) != len(self.domain[dir_neighbours[0]][dir_neighbours[1]]):
-                            self.domain[dir_neighbours[0]][dir_neighbours[1]] = temp_domain
-
-                for neighbour in neighbours:
-                    temp_domain_pipe1 = self.domain[row][col].copy()
-                    if self.is_optimal(neighbour[0], neighbour[1]) and (row, col) not in self.get_neighbours(neighbour[0], neighbour[1], self.domain[neighbour[0]][neighbour[1]][0]):
-                        for val in self.domain[row][col]:
-                            if self.neighbour_points_towards(row, col, val, neighbour[0], neighbour[1]):
-                                temp_domain_pipe1.remove(val)
-                        if len(temp_domain_pipe1) != len(self.domain[row][col]):
-                            self.domain[row][col] = temp_domain_pipe1
-
-                    temp_domain_pipe2 = self.domain[neighbour[0]][neighbour[1]].copy()
-                    if pipe1.startswith("F"):
-                        for val in self.domain[neighbour[0]][neighbour[1]]:
-                            if self.neighbour_points_towards(neighbour[0], neighbour[1], val, row, col) and val.startswith("F"):
-                                temp_domain_pipe2.remove(val)
-                        if len(temp_domain_pipe2) != len(self.domain[neighbour[0]][neighbour[1]]):
-                            self.domain[neighbour[0]][neighbour[1]] = temp_domain_pipe2
-
+            neighbour = nei_row * self.cols + nei_col
+            opposite = (direction + 2) % 4
+            source, target = domain[index], domain[neighbour]
+            if self.restrict(neighbour, SUPPORTED[direction][source]):
+                changed.append(neighbour)
+                if self.reasons is not None:
+                    self.explain(neighbour, self.reasons[index])
+                if stats is not None:
+                    stats.prune(pruning_rule(direction, source), target, domain[neighbour])
+            source, target = domain[neighbour], domain[index]
+            if self.restrict(index, SUPPORTED[opposite][source]):
+                changed.append(index)
+                if self.reasons is not None:
+                    self.explain(index, self.reasons[neighbour])
+                if stats is not None:
+                    stats.prune(pruning_rule(opposite, source), target, domain[index])
+        if stats is not None:
+            stats.add("propagate_algorithm", time.perf_counter() - start)
+        return changed
 
 
     def optimal_piece_count(self):
-        optimal_piece_count_local = 0
-        for row in range(len(self.domain)):
-            for col in range(len(self.domain[row])):
-                if len(self.domain[row][col]) == 1:
-                    optimal_piece_count_local += 1
-        return optimal_piece_count_local
+        """Number of cells left with exactly one rotation."""
+        return len(self.domain) - self.unresolved_count()
 
     def serialize(self):
-        return ''.join(''.join(cell[0] for cell in row) for row in self.domain)
+        """Returns a compact key of the current rotations and domains, used to compare states."""
+        return bytes(self.values) + self.domain.tobytes()
 
     @staticmethod
     def parse_instance() -> 'Board':
         """Reads the content of the file 'test.txt' and returns an instance of the Board class."""
-        content = sys.stdin.read()
-
-        # Split the content into rows and columns and create a two-dimensional grid
-        grid = [line.split('\t') for line in content.strip().split('\n')]
-
-        # Initialize the wrapper grid as a list of lists
-        wrapper_grid = []
-        for row in range(len(grid)):
-            row_list = []  # Initialize an empty list for each row
-            for col in range(len(grid[row])):
-                row_list.append([grid[row][col]])  # Append the string as a single-element list
-            wrapper_grid.append(row_list)  # Append the row list to the wrapper grid
+        return Board.parse_bytes(sys.stdin.buffer.read())
 
-        # Return the Board object with the parsed grid
-        return Board(wrapper_grid)
+    @staticmethod
+    def parse_bytes(data: bytes) -> 'Board':
+        """Decodes a board from its raw bytes without creating per-cell objects:
+        the shape is checked with strided slices and the piece codes are turned
+        into masks with translation tables. Raises ValueError on bad input."""
+        data = data.replace(b"\r", b"").strip()
+        if not data:
+            raise ValueError("empty board")
+        width = data.find(b"\n")
+        if width == -1:
+            width = len(data)
+        rows = (len(data) + 1) // (width + 1)
+        cols = (width + 1) // 3
+        if width % 3 != 2 or len(data) != rows * (width + 1) - 1 or data[width::width + 1] != b"\n" * (rows - 1):
+            raise ValueError("rows must all hold the same number of tab-separated two-letter codes")
+
+        cells = data.replace(b"\n", b"\t")
+        if cells[2::3] != b"\t" * (rows * cols - 1):
+            raise ValueError("rows must all hold the same number of tab-separated two-letter codes")
+        types = cells[0::3].translate(PIECE_TYPE_CODES)
+        orientations = cells[1::3].translate(ORIENTATION_CODES)
+        codes = (int.from_bytes(types, "big") | int.from_bytes(orientations, "big")).to_bytes(rows * cols, "big")
+        values = bytearray(codes.translate(CODE_MASKS))
+        invalid = values.find(0xFF)
+        if invalid != -1:
+            row, col = divmod(invalid, cols)
+            raise ValueError("unknown piece code %r at row %d, column %d"
+                             % (cells[3 * invalid:3 * invalid + 2].decode(errors="replace"), row + 1, col + 1))
+        return Board(values, rows, cols)
 
+    @staticmethod
+    def parse_stream(stream) -> Iterator[Union['Board', ValueError]]:
+        """Reads boards one at a time from a text stream. Boards are separated
+        by blank lines, or preceded by a header line with their number of rows.
+        Each board is decoded with parse_bytes, and one that cannot be comes
+        out as its ValueError instead, so that it does not end the stream."""
+        lines = []
+        pending = 0  # rows still to read for a board announced by a header
+
+        def decode() -> Union[Board, ValueError]:
+            try:
+                return Board.parse_bytes("\n".join(lines).encode())
+            except ValueError as error:
+                return error
+            finally:
+                del lines[:]
+
+        for line in stream:
+            line = line.rstrip('\r\n')
+            if pending:
+                lines.append(line)
+                pending -= 1
+                if not pending:
+                    yield decode()
+            elif not line.strip() or line.strip().isdigit():
+                if lines:
+                    yield decode()
+                pending = int(line) if line.strip() else 0
+            else:
+                lines.append(line)
+        if lines:
+            yield decode()
 
 
 class PipeMania(search.Problem):
     def __init__(self, board: Board):
         """O construtor especifica o estado inicial."""
-        super().__init__(PipeManiaState(board))
+        super().__init__(PipeManiaState.from_board(board))
+        self.board = board  # where result works out the children of states
         self.visited_states: Set[str] = set()
+        self.nodes = self.backtracks = 0  # decisions and failures of backtracking_search
+        self.backjumps = self.learnt = 0  # levels skipped and nogoods learnt by backjumping
+        self.nogoods = {}  # (cell, rotation) -> nogoods containing that decision
 
-    def actions(self, state: 'PipeManiaState') -> List[Tuple[int, int, str]]:
+    def actions(self, state: 'PipeManiaState') -> List[Tuple[int, int, int]]:
         """Retorna uma lista de ações que podem ser executadas a partir do estado passado como argumento."""
         actions_list = []
-        for row in range(len(state.board.domain)):
-            for col in range(len(state.board.domain)):
-                if len(state.board.domain[row][col]) > 1:
-                    for i in range(1, len(state.board.domain[row][col])):
-                        actions_list.append((row, col, state.board.domain[row][col][i]))
+        board = state.board
+        if 0 in board.domain:
+            return actions_list
+        for index, domain in enumerate(board.domain):
+            if domain & (domain - 1):
+                row, col = divmod(index, board.cols)
+                for rotation in domain_values(domain):
+                    actions_list.append((row, col, rotation))
 
         # Count the frequency of each coordinate
         coord_counts = Counter((row, col) for row, col, _ in actions_list)
@@ -478,376 +1280,776 @@ class PipeMania(search.Problem):
         return actions_list
 
 
-
-    def incompatible_pieces_list(self, input_piece: str):
-        """Based on a piece input determines which pieces are incompatible with it"""
-        incompatible_list = []
-        if input_piece == 'FC':
-            incompatible_list = ['BC', 'VC', 'LH', 'FE', 'FD', 'VD']
-        if input_piece == 'FB':
-            incompatible_list = ['FE', 'FD', 'BB', 'VB', 'LH', 'VE']
-        if input_piece == 'FE':
-            incompatible_list = ['FC', 'FB', 'VC', 'BE', 'VE', 'LV']
-        if input_piece == 'FD':
-            incompatible_list = ['FC', 'FB', 'VB', 'LV', 'BD', 'VD']
-        return incompatible_list
-
-    def piece_compatibility_converter(self, state: PipeManiaState, input_piece: str, row: int, col: int) -> bool:
-        """Converts pieces into the check_incompatibility function"""
-        horizontal_positions = state.board.adjacent_horizontal_values(row, col)
-        vertical_positions = state.board.adjacent_vertical_values(row, col)
-        if input_piece.startswith("F"):
-            orientation = input_piece[1]
-            if orientation == "C" and (
-                    vertical_positions[0] is None or vertical_positions[0] in self.incompatible_pieces_list('FC') or
-                    vertical_positions[0].startswith("F")):
-                return False
-
-            elif orientation == "B" and (
-                    vertical_positions[1] is None or vertical_positions[1] in self.incompatible_pieces_list('FB') or
-                    vertical_positions[1].startswith("F")):
-                return False
-
-            elif orientation == "E" and (
-                    horizontal_positions[0] is None or horizontal_positions[0] in self.incompatible_pieces_list('FE') or
-                    horizontal_positions[0].startswith("F")):
-                return False
-
-            elif orientation == "D" and (
-                    horizontal_positions[1] is None or horizontal_positions[1] in self.incompatible_pieces_list('FD') or
-                    horizontal_positions[1].startswith('F')):
-                return False
-
-        elif input_piece.startswith("B"):
-            orientation = input_piece[1]
-            if (orientation == "C" and
-                    (self.check_incompatibility(state, 'FC', row, col) or
-                     self.check_incompatibility(state, 'FE', row, col)
-                     or self.check_incompatibility(state, 'FD', row, col))):
-                return False
-
-            elif (orientation == "B" and
-                  (self.check_incompatibility(state, 'FE', row, col) or
-                   self.check_incompatibility(state, 'FB', row, col)
-                   or self.check_incompatibility(state, 'FD', row, col))):
-                return False
-
-            elif (orientation == "E" and
-                  (self.check_incompatibility(state, 'FC', row, col) or
-                   self.check_incompatibility(state, 'FE', row, col)
-                   or self.check_incompatibility(state, 'FB', row, col))):
-                return False
-
-
-            elif (orientation == "D" and
-                  (self.check_incompatibility(state, 'FC', row, col) or
-                   self.check_incompatibility(state, 'FD', row, col)
-                   or self.check_incompatibility(state, 'FB', row, col))):
-                return False
-
-        elif input_piece.startswith("V"):
-            orientation = state.board.domain[row][col][0][1]
-            if (orientation == "C" and
-                    (self.check_incompatibility(state, 'FC', row, col) or
-                     self.check_incompatibility(state, 'FE', row, col))):
-                return False
-
-            elif (orientation == "B" and
-                  (self.check_incompatibility(state, 'FD', row, col) or
-                   self.check_incompatibility(state, 'FB', row, col))):
-                return False
+    def check_compatibility_pair(self, first_piece: int, first_row: int, first_col: int, second_piece: int, second_row: int, second_col: int):
+        """Based on a pair of pieces determines if they are compatible between each other"""
+        return check_compatibility_pair(first_piece, first_row, first_col, second_piece, second_row, second_col)
 
 
-            elif (orientation == "E" and
-                  (self.check_incompatibility(state, 'FE', row, col) or
-                   self.check_incompatibility(state, 'FB', row, col))):
-                return False
+    def result(self, state: 'PipeManiaState', action: Tuple[int, int, int]) -> 'PipeManiaState':
+        """Retorna o estado resultante de executar a 'action' sobre 'state' passado como argumento."""
+        row, col, rotation = action
+        board = self.board
+        board.checkout(state)
+
+        # Decide the cell and propagate on the problem's board, then take the
+        # cells that changed into the child and undo them; a dead end is
+        # marked with an empty domain
+        index = row * board.cols + col
+        trail, board.trail = board.trail, []
+        board.set_domain(index, 1 << rotation)
+        if not board.propagate((index,)):
+            board.set_domain(index, 0)
+        child = state.child(board, {index for index, domain, _ in board.trail if domain is not None})
+        board.undo(0)
+        board.trail = trail
+        return child
 
+    def goal_test(self, state: 'PipeManiaState') -> bool:
+        """Retorna True se e só se o estado passado como argumento é
+        um estado objetivo. Deve verificar se todas as posições do tabuleiro
+        estão preenchidas de acordo com as regras do problema."""
+        return state.measure()[0] == 0
+
+    def h(self, node) -> float:
+        """1 while some cell is unresolved and 0 at a goal: every action
+        costs 1, as in search.Problem.path_cost, and a single decision may
+        leave propagation to settle all the rest, so no larger bound is
+        admissible. astar_search with it finds a solution with the fewest
+        decisions, breadth first. Infinite on a dead end."""
+        if node.state.dead:
+            return math.inf
+        return min(node.state.measure()[0], 1)
+
+    def h_unresolved(self, node) -> float:
+        """The number of unresolved cells. Not admissible, as one decision
+        may settle many cells, but it tells apart states close to a goal,
+        for greedy_search. Infinite on a dead end."""
+        if node.state.dead:
+            return math.inf
+        return node.state.measure()[0]
+
+    def h_rotations(self, node) -> float:
+        """A third of the rotations left to rule out, rounded up: the
+        decisions needed if each one only settled its own cell, which has
+        at most three rotations to rule out. Not admissible either."""
+        if node.state.dead:
+            return math.inf
+        rotations = node.state.measure()[1]
+        return -(-(rotations - node.state.rows * node.state.cols) // 3)
+
+    def h_open_ends(self, node) -> float:
+        """A quarter of the unsatisfied connections, rounded up: the
+        decisions needed if each one only settled the four sides of its
+        cell. Not admissible either."""
+        if node.state.dead:
+            return math.inf
+        return -(-node.state.measure()[2] // 4)
+
+    def backtracking_search(self, heuristic: str = "first", seed: int = None, restart_limit: int = None,
+                            backjumping: bool = True, cells: List[int] = None) -> 'Board':
+        """Depth-first search over the rotations of the initial board, done in
+        place: every domain reduction goes to the board trail and is undone
+        on backtrack, and constraints are propagated after each decision.
+
+        `heuristic` picks the cell to branch on: "first" takes the first
+        undecided cell in row-major order, "mrv" one with the fewest rotations
+        left. With a `seed` the rotations of a cell are tried in random order,
+        and with a `restart_limit` the search starts over from the root after
+        that many failures, the limit growing by half on every restart.
+
+        With `backjumping`, every domain reduction is explained by the
+        decision levels it depends on (Board.reasons). When all the rotations
+        of a cell fail, the search jumps back to the most recent decision
+        their failures depend on instead of the previous one, and learns the
+        decisions involved as a nogood, kept until the end of the solve.
+
+        With `cells`, only those cells are branched on and the search ends
+        once they are all decided. If the board already has a trail, the
+        search adds to it and leaves it there, so that the caller can undo
+        what it did. Returns the solved board, or None if there is no solution."""
+        board = self.board
+        # The search ends when no cell is left to branch on and never hashes
+        # a state, so the goal counters and the Zobrist hash are dropped
+        # rather than kept up to date on every change; they are counted
+        # again on next use
+        board._unresolved = board._unsatisfied = board._zobrist = None
+        board.version = None  # the board no longer holds the state it was checked out at
+        nested = board.trail is not None
+        if not nested:
+            board.trail = []
+        if board.connectivity is None:
+            board.connectivity = Connectivity(board)
+        if backjumping:
+            board.reasons = [0] * len(board.domain)
+            board.explained = []
+        select = self.select_smallest_domain_cell if heuristic == "mrv" else self.select_unassigned_cell
+        order = range(len(board.domain)) if cells is None else sorted(cells)
+        rng = random.Random(seed) if seed is not None else None
+        stack = []  # (trail mark, explanation mark, position in order, rotations left to try), one per decision level
+        conflicts = []  # per decision level, the earlier levels its failures depend on
+        start = 0
+        failures = 0
+        fixed = len(board.connectivity.history)
+        consistent = board.propagate(order)
+        root = len(board.trail)
+        try:
+            while True:
+                if consistent:
+                    start = select(board, start, order)
+                    if start is None:
+                        if nested and backjumping:
+                            # Later searches on this trail start from these decisions
+                            board.connectivity.settle(fixed)
+                        return board
+                    rotations = domain_values(board.domain[order[start]])
+                    if rng is not None:
+                        rng.shuffle(rotations)
+                    stack.append((len(board.trail), len(board.explained) if backjumping else 0, start, rotations))
+                    conflicts.append(board.reasons[order[start]] if backjumping else 0)
+                else:
+                    self.backtracks += 1
+                    failures += 1
+                    if backjumping and stack:
+                        conflicts[-1] |= board.conflict & ~(1 << len(stack))
+                    if restart_limit is not None and failures >= restart_limit and stack:
+                        board.undo(root)
+                        if backjumping:
+                            board.unexplain(0)
+                        stack.clear()
+                        conflicts.clear()
+                        start = failures = 0
+                        restart_limit *= 1.5
+                        consistent = True
+                        continue
+
+                while stack:
+                    mark, explained, start, rotations = stack[-1]
+                    board.undo(mark)
+                    if backjumping:
+                        board.unexplain(explained)
+                    if rotations:
+                        self.nodes += 1
+                        consistent = self.decide(board, order[start], rotations.pop(), len(stack))
+                        break
+                    stack.pop()
+                    conflict = conflicts.pop()
+                    if backjumping:
+                        # Every rotation failed because of the decisions in `conflict`
+                        level = conflict.bit_length() - 1
+                        if level <= 0:
+                            return None
+                        self.learn(board, [order[entry[2]] for entry in stack[:level]], conflict)
+                        self.backjumps += len(stack) - level
+                        del stack[level:]
+                        del conflicts[level:]
+                        conflicts[-1] |= conflict & ~(1 << level)
+                else:
+                    return None
+        finally:
+            if not nested:
+                board.trail = None
+            board.reasons = board.explained = None
+
+    def decide(self, board: Board, cell: int, rotation: int, level: int) -> bool:
+        """Makes `rotation` the decision of `level` for `cell` and propagates.
+        While backjumping, the nogoods that contain this decision are checked
+        first: one whose other decisions all hold is a failure, and one with a
+        single other decision left open rules that decision out."""
+        board.restrict(cell, 1 << rotation)
+        if board.reasons is None:
+            return board.propagate((cell,))
+        board.explain(cell, 1 << level)
+        cells = [cell]
+        for nogood in self.nogoods.get((cell, rotation), ()):
+            reason, unit = 0, None
+            for other, value in nogood:
+                domain = board.domain[other]
+                if domain == 1 << value:
+                    reason |= board.reasons[other]
+                elif domain >> value & 1 and unit is None:
+                    unit = other, value
+                else:
+                    break
+            else:
+                if unit is None:
+                    board.conflict = reason
+                    return False
+                other, value = unit
+                board.restrict(other, ~(1 << value))
+                board.explain(other, reason)
+                cells.append(other)
+        return board.propagate(cells)
+
+    def learn(self, board: Board, decided: List[int], conflict: int):
+        """Records the decisions of the levels in `conflict` as a nogood,
+        indexed by each of its (cell, rotation) decisions. `decided` holds
+        the cell of every decision level from 1."""
+        nogood = []
+        while conflict:
+            level = conflict.bit_length() - 1
+            conflict ^= 1 << level
+            cell = decided[level - 1]
+            nogood.append((cell, board.values[cell]))
+        if len(nogood) > MAX_NOGOOD_SIZE:
+            return
+        nogood = tuple(nogood)
+        for decision in nogood:
+            self.nogoods.setdefault(decision, []).append(nogood)
+        self.learnt += 1
+
+    def select_unassigned_cell(self, board: Board, start: int, order):
+        """Returns the position of the first cell of `order` from `start`
+        onwards that still has more than one rotation. Cells before `start`
+        are known to be decided."""
+        domain = board.domain
+        for position in range(start, len(order)):
+            index = order[position]
+            if domain[index] & (domain[index] - 1):
+                return position
+        return None
+
+    def select_smallest_domain_cell(self, board: Board, start: int, order):
+        """Returns the position in `order` of an undecided cell with the fewest
+        rotations left."""
+        best, best_size = None, 5
+        domains = board.domain
+        for position, index in enumerate(order):
+            domain = domains[index]
+            if domain & (domain - 1):
+                size = bin(domain).count("1")
+                if size < best_size:
+                    best, best_size = position, size
+                    if size == 2:
+                        break
+        return best
 
-            elif (orientation == "D" and
-                  (self.check_incompatibility(state, 'FC', row, col) or
-                   self.check_incompatibility(state, 'FD', row, col))):
-                return False
+    def longest_continuous_pipe_length(self, state: 'PipeManiaState') -> int:
+        """Size of the largest set of connected pieces that contains an end piece."""
+        board = state.board
+        labels, sizes, _, _ = board.label_components()
+        return max((sizes[labels[index]] for index, value in enumerate(board.values) if END_PIECES >> value & 1),
+                   default=0)
 
-        elif input_piece.startswith("L"):
-            orientation = state.board.domain[row][col][0][1]
-            if (orientation == "H" and
-                    (self.check_incompatibility(state, 'FE', row, col) or
-                     self.check_incompatibility(state, 'FD', row, col))):
-                return False
 
-            if (orientation == "V" and
-                    (self.check_incompatibility(state, 'FC', row, col) or
-                     self.check_incompatibility(state, 'FB', row, col))):
-                return False
-        return True
+class InstrumentedPipeMania(search.InstrumentedProblem):
+    """Delegates to a PipeMania like search.InstrumentedProblem, and also
+    times actions, result and goal_test into a SolverStats."""
 
-    def is_piece_left_oriented(self, input_piece: str) -> bool:
-        """Check if piece is left oriented(continues a pipe that comes from left)"""
-        if input_piece.startswith("L"):
-            if input_piece[1] == "H":
-                return True
-        elif input_piece.startswith("V"):
-            if input_piece[1] == "E" or input_piece[1] == "C":
-                return True
-        elif input_piece.startswith("B"):
-            if input_piece[1] != "D":
-                return True
-        elif input_piece.startswith("F"):
-            if input_piece[1] == "E":
-                return True
-        return False
+    def __init__(self, problem: PipeMania, stats: SolverStats):
+        super().__init__(problem)
+        self.stats = stats
 
+    def actions(self, state):
+        start = time.perf_counter()
+        actions = super().actions(state)
+        self.stats.add("actions", time.perf_counter() - start)
+        return actions
 
-    def is_piece_right_oriented(self, input_piece: str) -> bool:
-        """Check if piece is right oriented(continues a pipe that comes from right)"""
-        if input_piece.startswith("L"):
-            if input_piece[1] == "H":
-                return True
-        elif input_piece.startswith("V"):
-            if input_piece[1] == "B" or input_piece[1] == "D":
-                return True
-        elif input_piece.startswith("B"):
-            if input_piece[1] != "E":
-                return True
-        elif input_piece.startswith("F"):
-            if input_piece[1] == "D":
-                return True
-        return False
-
-    def is_piece_up_oriented(self, input_piece: str) -> bool:
-        """Check if piece is up oriented(continues a pipe that comes from above)"""
-        if input_piece.startswith("L"):
-            if input_piece[1] == "V":
-                return True
-        elif input_piece.startswith("V"):
-            if input_piece[1] == "C" or input_piece[1] == "D":
-                return True
-        elif input_piece.startswith("B"):
-            if input_piece[1] != "B":
-                return True
-        elif input_piece.startswith("F"):
-            if input_piece[1] == "C":
-                return True
-        return False
+    def result(self, state, action):
+        start = time.perf_counter()
+        new_state = super().result(state, action)
+        self.stats.add("result", time.perf_counter() - start)
+        return new_state
 
-    def is_piece_down_oriented(self, input_piece: str) -> bool:
-        """Check if piece is down oriented(continues a pipe that comes from below)"""
-        if input_piece.startswith("L"):
-            if input_piece[1] == "V":
-                return True
-        elif input_piece.startswith("V"):
-            if input_piece[1] == "B" or input_piece[1] == "E":
-                return True
-        elif input_piece.startswith("B"):
-            if input_piece[1] != "C":
-                return True
-        elif input_piece.startswith("F"):
-            if input_piece[1] == "B":
-                return True
+    def goal_test(self, state):
+        start = time.perf_counter()
+        goal = super().goal_test(state)
+        self.stats.add("goal_test", time.perf_counter() - start)
+        return goal
+
+
+def solve_board(board: Board, order: str = "fifo", heuristic: str = "first", seed: int = None,
+                restart_limit: int = None, stats: dict = None, profile: bool = False,
+                vectorize: bool = None, backjumping: bool = True, backend: str = "search",
+                regions: bool = False, jobs: int = 1, probes: int = None, probe_seconds: float = None,
+                verify: bool = False) -> Board:
+    """Constrains the board and searches what propagation leaves undecided,
+    with PipeMania.backtracking_search or, if `backend` is "sat", with
+    solve_sat, and if it is "astar" or "greedy" with solve_informed. `order` is
+    "fifo" or "lifo" for the propagation queue, `vectorize` runs the first
+    propagation pass with numpy (by default on boards of at least
+    VECTORIZE_CELLS cells), `probes` and `probe_seconds` run Board.probe after
+    it with that budget, `regions` searches each region of undecided cells on
+    its own with solve_regions, in `jobs` processes, and the other options go
+    to PipeMania.backtracking_search. If a `stats` dict is given it receives
+    the propagation and search counters, among them the number of cells left
+    `undecided` for the search, and with `profile` also the SolverStats summary
+    under "profile". With `verify`, a solution is checked with Board.violation
+    and a RuntimeError raised if it is wrong. Returns the solved board, or None
+    if there is no solution."""
+    board.lifo = order == "lifo"
+    board.vectorized = board.rows * board.cols >= VECTORIZE_CELLS if vectorize is None else vectorize
+    if profile:
+        board.stats = SolverStats()
+    consistent = board.constraint_domain()
+    if consistent and (probes is not None or probe_seconds is not None):
+        consistent = board.probe(probes, probe_seconds)
+    problem = PipeMania(board)
+    if profile:
+        problem = InstrumentedPipeMania(problem, board.stats)
+    start = time.perf_counter() if profile else 0.0
+    undecided = board.unresolved_count()
+    if not consistent:
+        solved = False
+    elif problem.goal_test(problem.initial):
+        solved = True
+    elif backend == "sat":
+        solved = solve_sat(board, stats)
+    elif backend in ("astar", "greedy"):
+        solved = solve_informed(problem, backend)
+    elif regions:
+        solved = solve_regions(problem.problem if profile else problem, jobs, stats, heuristic=heuristic, seed=seed, restart_limit=restart_limit,
+                               backjumping=backjumping)
+    else:
+        solved = problem.backtracking_search(heuristic, seed, restart_limit, backjumping) is not None
+    if profile:
+        board.stats.add("search", time.perf_counter() - start)
+    if stats is not None:
+        stats.update(rows=board.rows, cols=board.cols, solved=solved, reductions=board.reductions,
+                     probes=board.probes, undecided=undecided, nodes=problem.nodes, backtracks=problem.backtracks, backjumps=problem.backjumps,
+                     nogoods=problem.learnt)
+        if profile:
+            stats.update(profile=board.stats.summary())
+    board.stats = None
+    if solved and verify:
+        violation = board.violation()
+        if violation is not None:
+            raise RuntimeError("invalid solution: %s" % violation)
+    return board if solved else None
+
+
+def solve_sat(board: Board, stats: dict = None) -> bool:
+    """Solves a constrained board with the CDCL solver of sat.py on its CNF.
+    Connectivity is enforced lazily: while a model leaves the pipes in more
+    than one set, each set gets a clause that one of the connections out of
+    it opens, and the solver runs again keeping what it learnt. Writes the
+    rotations into the board. If a `stats` dict is given it receives the
+    counters of the SAT solver. Returns whether the board was solved."""
+    import sat
+    if 0 in board.domain:
         return False
-
-
-    def check_incompatibility(self, state: PipeManiaState, input_piece: str, row: int, col: int) -> bool:
-        """Based on a piece input determines which pieces are incompatible with it"""
-        horizontal_positions = state.board.adjacent_horizontal_values(row, col)
-        vertical_positions = state.board.adjacent_vertical_values(row, col)
-        if input_piece.startswith("F"):
-            orientation = input_piece[1]
-            if orientation == "C" and (vertical_positions[0] is None or vertical_positions[0] in self.incompatible_pieces_list('FC')):
-                return True
-
-            elif orientation == "B" and (vertical_positions[1] is None or vertical_positions[1] in self.incompatible_pieces_list('FB')):
-                return True
-
-            elif orientation == "E" and (horizontal_positions[0] is None or horizontal_positions[0] in self.incompatible_pieces_list('FE')):
-                return True
-
-            elif orientation == "D" and (horizontal_positions[1] is None or horizontal_positions[1] in self.incompatible_pieces_list('FD')):
-                return True
-
+    variables, clauses = board.to_cnf()
+    solver = sat.Solver(len(variables))
+    for clause in clauses:
+        solver.add_clause(clause)
+    cuts = 0
+    solved = False
+    while True:
+        model = solver.solve()
+        if model is None:
+            break
+        values = bytearray(board.values)
+        for (index, value), variable in variables.items():
+            if model[variable]:
+                values[index] = value
+        components = board.components(values)
+        if len(components) == 1:
+            for index, value in enumerate(values):
+                if board.domain[index] & (board.domain[index] - 1):
+                    board.set_domain(index, 1 << value)
+            solved = True
+            break
+        components.remove(max(components, key=len))
+        for component in components:
+            solver.add_clause(board.cut_clause(component, variables))
+            cuts += 1
+    if stats is not None:
+        stats.update(decisions=solver.decisions, conflicts=solver.conflicts, restarts=solver.restarts,
+                     learnt=len(solver.learnts), cuts=cuts)
+    return solved
+
+
+def solve_informed(problem: PipeMania, backend: str) -> bool:
+    """Solves a constrained board over the states made by PipeMania.result,
+    with search.astar_search and PipeMania.h or with search.greedy_search and
+    PipeMania.h_unresolved. Leaves the board at the goal state, and returns
+    whether there was one. Only the goal state is needed, so the nodes are
+    search.LeanNode, which keep no parent or action."""
+    if backend == "astar":
+        node = search.astar_search(problem, node_class=search.LeanNode)
+    else:
+        node = search.greedy_search(problem, problem.h_unresolved, node_class=search.LeanNode)
+    if node is None:
         return False
-
-    def check_compatibility_pair(self, first_piece: str, first_row: int, first_col: int, second_piece: str, second_row: int, second_col: int):
-        """Based on a pair of pieces determines if they are compatible between each other"""
-        if first_row == second_row:
-            if first_col < second_col:
-                if self.is_piece_right_oriented(first_piece) and self.is_piece_left_oriented(second_piece):
-                    if first_piece.startswith("F") and second_piece.startswith("F"):
-                        return False
-                    return True
-            elif first_col > second_col:
-                if self.is_piece_right_oriented(second_piece) and self.is_piece_left_oriented(first_piece):
-                    if first_piece.startswith("F") and second_piece.startswith("F"):
-                        return False
-                    return True
-        elif first_col == second_col:
-            if first_row < second_row:
-                if self.is_piece_down_oriented(first_piece) and  self.is_piece_up_oriented(second_piece):
-                    if first_piece.startswith("F") and second_piece.startswith("F"):
-                        return False
-                    return True
-            elif first_row > second_row:
-                if self.is_piece_down_oriented(second_piece) and self.is_piece_up_oriented(first_piece):
-                    if first_piece.startswith("F") and second_piece.startswith("F"):
-                        return False
-                    return True
+    problem.board.checkout(node.state)
+    return True
+
+
+def solve_regions(problem: PipeMania, jobs: int = 1, stats: dict = None, **options) -> bool:
+    """Searches the regions of undecided cells of a constrained board one at
+    a time, each with PipeMania.backtracking_search branching on its cells
+    only, so that a failure in one region never goes back into another.
+    With `jobs` > 1 the regions are split between that many processes and
+    their rotations merged back and propagated here.
+
+    Regions only meet through the connectivity of the pipes, and a region
+    that cannot be solved after the others (or a merge that closes a loop
+    or leaves the pipes apart) undoes everything and falls back to one
+    search over the whole board. A board with a single region is searched
+    whole from the start, which is not counted as a fallback. If a `stats`
+    dict is given it receives the number of regions and whether the
+    fallback ran. Returns whether the
+    board was solved, and False at once if some domain is already empty,
+    since no region would propagate into a cell outside it."""
+    board = problem.board
+    if 0 in board.domain:
+        if stats is not None:
+            stats.update(regions=0, fallback=False)
         return False
-
-
-    def result(self, state: 'PipeManiaState', action: Tuple[int, int, str]) -> 'PipeManiaState':
-        """Retorna o estado resultante de executar a 'action' sobre 'state' passado como argumento."""
-        row, col, rotation = action
-        board = state.board
-
-        # Create a copy of the board grid to modify
-        new_domain = [row[:] for row in board.domain]
-
-        # Update the piece at the specified position with the given rotation
-        new_piece = rotation
-        replaced_piece_index = new_domain[row][col].index(new_piece)
-        temp_row = new_domain[row][col].copy()
-        new_domain[row][col][0] = new_piece
-        new_domain[row][col][replaced_piece_index] = temp_row[0]
-        new_state = PipeManiaState(Board(new_domain))
-        return new_state
-
-    def get_possible_rotations(self, piece_type: str) -> List[str]:
-        """Returns the possible rotations for a given piece type."""
-        if piece_type == "F":
-            return ["FC", "FD", "FE", "FB"]
-        elif piece_type == "B":
-            return ["BC", "BB", "BE", "BD"]
-        elif piece_type == "V":
-            return ["VC", "VB", "VE", "VD"]
-        elif piece_type == "L":
-            return ["LH", "LV"]
+    regions = board.regions()
+    if len(regions) <= 1:  # nothing to split: the usual search, not a fallback
+        if stats is not None:
+            stats.update(regions=len(regions), fallback=False)
+        return problem.backtracking_search(**options) is not None
+    board.trail = []
+    try:
+        if jobs > 1:
+            solved = merge_regions(problem, run_regions(board, regions, jobs, options))
         else:
-            return []
-
-    def goal_test(self, state: 'PipeManiaState') -> bool:
-        """Retorna True se e só se o estado passado como argumento é
-        um estado objetivo. Deve verificar se todas as posições do tabuleiro
-        estão preenchidas de acordo com as regras do problema."""
-        for row in range(len(state.board.domain)):
-            for col in range(len(state.board.domain[row])):
-                if len(state.board.domain[row][col]) != 1:
-                    return False
+            solved = all(problem.backtracking_search(cells=region, **options) is not None for region in regions)
+        if not solved:
+            board.undo(0)
+    finally:
+        board.trail = None
+    if stats is not None:
+        stats.update(regions=len(regions), fallback=not solved)
+    if solved:
         return True
+    problem.nogoods.clear()  # learnt with the decisions of other regions taken for granted
+    return problem.backtracking_search(**options) is not None
+
+
+def merge_regions(problem: PipeMania, results) -> bool:
+    """Decides the cells of every region as a worker solved them and
+    propagates. `results` are the (cells, rotations, nodes, backtracks)
+    of each region of run_regions, with None rotations for a region that
+    failed. Returns whether the merged board is solved."""
+    board = problem.board
+    decided = []
+    for cells, values, nodes, backtracks in results:
+        problem.nodes += nodes
+        problem.backtracks += backtracks
+        if values is None:
+            return False
+        for index, value in zip(cells, values):
+            board.restrict(index, 1 << value)
+        decided += cells
+    return board.propagate(decided)
+
+
+_region_board = None  # the board of a run_regions worker process
+
+
+def region_init(board: Board):
+    """run_regions worker initializer: keeps the board forked from the parent."""
+    global _region_board
+    _region_board = board
+
+
+def region_worker(regions: List[List[int]], options: dict) -> list:
+    """run_regions task: solves some regions of the worker's board in turn,
+    returning for each its cells, their rotations (None if it failed and the
+    rest were skipped) and the nodes and backtracks spent on it."""
+    board = _region_board
+    board.trail = []
+    results = []
+    for cells in regions:
+        problem = PipeMania(board)
+        solved = problem.backtracking_search(cells=cells, **options) is not None
+        results.append((cells, bytes(board.values[index] for index in cells) if solved else None,
+                        problem.nodes, problem.backtracks))
+        if not solved:
+            break
+    return results
+
+
+def run_regions(board: Board, regions: List[List[int]], jobs: int, options: dict) -> list:
+    """Solves the regions in `jobs` forked processes, dealing them out
+    largest first to the process with the fewest cells so far. Returns the
+    results of region_worker for every region."""
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    shares = [[] for _ in range(jobs)]
+    sizes = [0] * jobs
+    for region in sorted(regions, key=len, reverse=True):
+        lightest = sizes.index(min(sizes))
+        shares[lightest].append(region)
+        sizes[lightest] += len(region)
+    context = multiprocessing.get_context("fork")
+    with ProcessPoolExecutor(jobs, mp_context=context, initializer=region_init, initargs=(board,)) as executor:
+        futures = [executor.submit(region_worker, share, options) for share in shares if share]
+        return [result for future in futures for result in future.result()]
+
+
+# Solver configurations raced against each other by run_portfolio.
+PORTFOLIO = (
+    {"order": "fifo", "heuristic": "first"},
+    {"order": "lifo", "heuristic": "mrv"},
+    {"order": "fifo", "heuristic": "mrv", "seed": 1, "restart_limit": 100},
+    {"order": "lifo", "heuristic": "first", "seed": 2, "restart_limit": 100},
+)
+
+
+def portfolio_worker(board: Board, config: dict, connection):
+    """Portfolio process: solves its own copy of the board with one
+    configuration and sends the rotations (None if unsolved, or if the
+    solver raised) through `connection`."""
+    values = None
+    try:
+        if solve_board(board, **config):
+            values = bytes(board.values)
+    finally:
+        connection.send(values)
+
+
+def run_portfolio(board: Board, configs=PORTFOLIO, stats: dict = None) -> Board:
+    """Races the configurations on the same board, one process each. The first
+    one to solve it wins and the others are terminated. A process that dies
+    without an answer (killed, out of memory) leaves its pipe at EOF, and if
+    none of the others solved the board it is solved here with the first
+    configuration. If a `stats` dict is given it receives the winning
+    configuration and whether that fallback ran. Returns the solved board,
+    or None if every configuration failed."""
+    import multiprocessing
+    from multiprocessing.connection import wait
+    context = multiprocessing.get_context("fork")
+    processes, receivers = [], {}  # receiver -> position
+    for position, config in enumerate(configs):
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=portfolio_worker, args=(board, config, sender), daemon=True)
+        process.start()
+        sender.close()  # only the process holds it, so its exit shows as EOF
+        processes.append(process)
+        receivers[receiver] = position
+
+    solved = None
+    lost = False  # some process died without an answer
+    try:
+        pending = list(receivers)
+        while pending and solved is None:
+            for receiver in wait(pending):
+                pending.remove(receiver)
+                try:
+                    values = receiver.recv()
+                except EOFError:
+                    lost = True
+                    continue
+                if values is not None and solved is None:
+                    board.values = bytearray(values)
+                    solved = board
+                    if stats is not None:
+                        stats.update(winner=configs[receivers[receiver]])
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+        for receiver in receivers:
+            receiver.close()
+    fallback = solved is None and lost
+    if fallback:
+        solved = solve_board(board, **configs[0])
+        if solved is not None and stats is not None:
+            stats.update(winner=configs[0])
+    if stats is not None:
+        stats.update(rows=board.rows, cols=board.cols, solved=solved is not None, fallback=fallback)
+    return solved
+
+
+def run_batch(stream, out=sys.stdout, solver=solve_board, report=None):
+    """Solves every board of a stream in turn, writing each solution followed
+    by a blank line as soon as it is found (just the blank line if unsolved).
+    With a `report` file, the counters of each board go there as a JSON line.
+    A board that cannot be read is reported on stderr and left unsolved."""
+    for position, board in enumerate(Board.parse_stream(stream)):
+        stats = {} if report is not None else None
+        if isinstance(board, ValueError):
+            print("board %d: %s" % (position, board), file=sys.stderr, flush=True)
+            if stats is not None:
+                stats.update(solved=False, error=str(board))
+        elif solver(board, stats=stats):
+            board.print_board(out)
+        out.write("\n")
+        out.flush()
+        if report is not None:
+            print(json.dumps(stats), file=report, flush=True)
+
+
+def solve_worker(board: Board, options: dict) -> Tuple[int, float, bytes]:
+    """Pool task: solves a board with solve_board `options` and returns the
+    worker pid, the seconds it took and the solved rotations (None if unsolved)."""
+    start = time.perf_counter()
+    solved = solve_board(board, **options)
+    return os.getpid(), time.perf_counter() - start, bytes(board.values) if solved else None
+
+
+def run_pool(stream, jobs: int, ordered: bool = True, out=sys.stdout, report=sys.stderr, options: dict = None):
+    """Solves the boards of a stream across `jobs` worker processes. At most
+    two boards per worker are read ahead of the workers, and in input order no
+    more are read while four per worker are held, in flight or solved and
+    waiting behind a slower board. Solutions are written in input order, or in
+    completion order each preceded by a "# <position>" line. Per-worker
+    throughput is written to `report` at the end. `options` go to solve_board.
+    A board that cannot be read is reported on stderr and left unsolved."""
+    boards = enumerate(Board.parse_stream(stream))
+    pending = {}  # future -> (position, board)
+    finished = {}  # position -> board (None if unsolved), waiting to be written
+    next_position = 0
+    workers = {}  # pid -> [boards solved, busy seconds]
+
+    def write(position: int, board: Board):
+        if not ordered:
+            out.write("# %d\n" % position)
+        if board is not None:
+            board.print_board(out)
+        out.write("\n")
+        out.flush()
+
+    import multiprocessing
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+    context = multiprocessing.get_context("fork")
+    with ProcessPoolExecutor(jobs, mp_context=context) as executor:
+        reading = True
+        while True:
+            while reading and len(pending) < 2 * jobs and len(pending) + len(finished) < 4 * jobs:
+                position, board = next(boards, (None, None))
+                if board is None:
+                    reading = False
+                elif isinstance(board, ValueError):
+                    print("board %d: %s" % (position, board), file=sys.stderr, flush=True)
+                    finished[position] = None
+                else:
+                    pending[executor.submit(solve_worker, board, options or {})] = (position, board)
+            if pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    position, board = pending.pop(future)
+                    pid, seconds, values = future.result()
+                    workers.setdefault(pid, [0, 0.0])
+                    workers[pid][0] += 1
+                    workers[pid][1] += seconds
+                    if values is not None:
+                        board.values = bytearray(values)
+                    finished[position] = board if values is not None else None
+            if ordered:
+                while next_position in finished:
+                    write(next_position, finished.pop(next_position))
+                    next_position += 1
+            else:
+                for position in sorted(finished):
+                    write(position, finished.pop(position))
+            if not pending and not reading:
+                break
 
-    def longest_continuous_pipe_length(self, state: 'PipeManiaState') -> int:
-        max_length = 0
-        visited = set()
-
-        for row in range(len(state.board.domain)):
-            for col in range(len(state.board.domain[row])):
-                piece = state.board.get_value(row, col)
-                if (row, col) not in visited and piece.startswith("F"):  # Start exploring from a piece of the pipe
-                    length = self.dfs(state, row, col, visited)
-                    max_length = max(max_length, length)
-
-        return max_length
-
-    def dfs(self, state: PipeManiaState, row: int, col: int, visited: set) -> int:
-        if (row < 0 or row >= len(state.board.domain) - 1 or col < 0 or col >= len(state.board.domain[row]) - 1 or (row, col) in visited):
-            return 0
-
-        visited.add((row, col))
-        length = 1  # Start with length 1 for the current piece
-
-        # Check compatibility with adjacent pieces
-        for dr, dc in [(1, 0), (-1, 0), (0, 1), (0, -1)]:
-            new_row, new_col = row + dr, col + dc
-            if 0 <= new_row < len(state.board.domain) and 0 <= new_col < len(state.board.domain[row]):
-                next_piece = state.board.get_value(new_row, new_col)
-                if self.check_compatibility_pair(state.board.domain[row][col][0], row, col, next_piece, new_row, new_col) and (new_row, new_col) not in visited:
-                    length += self.dfs(state, new_row, new_col, visited)  # Recursively explore next piece
-        return length
-
-
-def fix_board_edges(domain: List[List[List[str]]]) -> List[List[List[str]]]:
-    """Fixes the rotations of the pieces on the edges of the board."""
-    new_domain = [row[:] for row in domain]
-    max_row = len(new_domain) - 1
-    max_col = len(new_domain) - 1
-
-    for row in range(len(new_domain)):
-        for col in range(len(new_domain[row])):
-            possible_rotations = []
-            piece = new_domain[row][col][0]
-            piece_type = piece[0]
-
-            if piece_type == "F":
-                if row == 0:
-                    possible_rotations = ["FD", "FE", "FB"]
-                if col == 0:
-                    possible_rotations = ["FC", "FD", "FB"]
-                if row == max_row:
-                    possible_rotations = ["FC", "FE", "FD"]
-                if col == max_col:
-                    possible_rotations = ["FC", "FD", "FB"]
-                if row == 0 and col == 0:
-                    possible_rotations = ["FD", "FB"]
-                if row == max_row and col == 0:
-                    possible_rotations = ["FC", "FD"]
-                if row == max_row and col == max_col:
-                    possible_rotations = ["FC", "FE"]
-                if row == 0 and col == max_col:
-                    possible_rotations = ["FB", "FE"]
-            elif piece_type == "B":
-                if row == 0:
-                    possible_rotations = ["BB"]
-                if col == 0:
-                    possible_rotations = ["BD"]
-                if row == max_row:
-                    possible_rotations = ["BC"]
-                if col == max_col:
-                    possible_rotations = ["BE"]
-            elif piece_type == "V":
-                if row == 0:
-                    possible_rotations = ["VB", "VE"]
-                if col == 0:
-                    possible_rotations = ["VB", "VD"]
-                if row == max_row:
-                    possible_rotations = ["VC", "VD"]
-                if col == max_col:
-                    possible_rotations = ["VE", "VC"]
-                if row == 0 and col == 0:
-                    possible_rotations = ["VB"]
-                if row == max_row and col == 0:
-                    possible_rotations = ["VD"]
-                if row == max_row and col == max_col:
-                    possible_rotations = ["VC"]
-                if row == 0 and col == max_col:
-                    possible_rotations = ["VE"]
-            elif piece_type == "L":
-                if row == 0:
-                    possible_rotations = ["LH"]
-                if col == 0:
-                    possible_rotations = ["LV"]
-                if row == max_row:
-                    possible_rotations = ["LH"]
-                if col == max_col:
-                    possible_rotations = ["LV"]
-
-            # Update the piece with the fixed rotations
-            if len(possible_rotations) > 0:
-                new_domain[row][col] = possible_rotations
-
-    return new_domain
-
-
-
-
-board = Board.parse_instance()
-initial_grid = board.domain
-fixed_grid = board.constraint_domain()
-# goal.node_state.astar_search()
-problem_fix = PipeMania(board)
-problem_fix_state = PipeManiaState(board)
-for i in range(10000):
-    if problem_fix.goal_test(problem_fix_state):
-        problem_fix_state.board.print_board()
-        break
+    for pid, (count, seconds) in sorted(workers.items()):
+        print("worker %d: %d boards in %.3fs (%.2f boards/s)" % (pid, count, seconds, count / seconds if seconds else 0.0),
+              file=report)
+
+
+def solve(board, **options) -> Tuple[List[List[str]], dict]:
+    """Solves a Board, or a grid of piece codes such as [["FB", "VC"], ...].
+    The options are those of solve_board. Returns the solved grid (None if
+    there is no solution) and the counters of solve_board."""
+    if not isinstance(board, Board):
+        board = Board.from_grid(board)
+    stats = {}
+    solved = solve_board(board, stats=stats, **options)
+    return (board.to_grid() if solved else None), stats
+
+
+def solve_text(text: str, **options) -> Tuple[List[List[str]], dict]:
+    """Like solve, for a board in the input format of Pipe.py."""
+    return solve(Board.parse_bytes(text.encode()), **options)
+
+
+def main(argv=None):
+    """Command line entry point, see --help."""
+    parser = argparse.ArgumentParser(description="Solves PipeMania boards.")
+    parser.add_argument("--batch", nargs="?", const="-", metavar="FILE",
+                        help="solve a stream of boards from FILE (default: stdin), separated by "
+                             "blank lines or preceded by a header line with their number of rows")
+    parser.add_argument("--jobs", type=int, default=1, metavar="N",
+                        help="solve batch boards, or with --regions the regions of a single board, "
+                             "in N worker processes")
+    parser.add_argument("--unordered", action="store_true",
+                        help="with --jobs, write solutions as they finish instead of in input order")
+    parser.add_argument("--portfolio", action="store_true",
+                        help="race several solver configurations on each board and keep the first solution")
+    parser.add_argument("--stats", action="store_true",
+                        help="write the propagation and search counters of each board to stderr as JSON")
+    parser.add_argument("--profile", action="store_true",
+                        help="like --stats, also timing every solver phase and counting the values pruned per rule")
+    parser.add_argument("--backend", choices=("search", "sat", "astar", "greedy"), default="search",
+                        help="solve what propagation leaves undecided by backtracking search, with the "
+                             "built-in CDCL SAT solver, or by A* or greedy best-first search over the "
+                             "unresolved cells (default: %(default)s)")
+    parser.add_argument("--regions", action="store_true",
+                        help="search the regions of cells left undecided by propagation one at a time")
+    parser.add_argument("--probe", type=int, metavar="N",
+                        help="after propagation, try up to N rotations of undecided cells and rule out "
+                             "those that wipe out a domain")
+    parser.add_argument("--probe-seconds", type=float, metavar="SECONDS",
+                        help="like --probe, for at most SECONDS")
+    parser.add_argument("--verify", action="store_true",
+                        help="check every solution with verify.py and fail on an invalid one")
+    parser.add_argument("--cnf", metavar="FILE",
+                        help="write the board to FILE as DIMACS CNF after propagation instead of solving it; "
+                             "connectivity is not encoded")
+    args = parser.parse_args(argv)
+    if args.portfolio and args.jobs > 1:
+        parser.error("--portfolio already uses one process per configuration and cannot be combined with --jobs")
+    if (args.stats or args.profile) and args.jobs > 1 and args.batch is not None:
+        parser.error("--stats and --profile are only available when boards are solved in this process")
+    if args.portfolio and (args.profile or args.backend != "search" or args.regions or
+                           args.probe is not None or args.probe_seconds is not None):
+        parser.error("--profile, --backend, --regions and --probe cannot be combined with --portfolio")
+    if args.cnf and args.batch is not None:
+        parser.error("--cnf writes a single board")
+    options = {"backend": args.backend}
+    if args.profile:
+        options.update(profile=True)
+    if args.regions:
+        options.update(regions=True)
+    if args.probe is not None or args.probe_seconds is not None:
+        options.update(probes=args.probe, probe_seconds=args.probe_seconds)
+    if args.verify:
+        options.update(verify=True)
+    if args.portfolio:
+        solver = functools.partial(run_portfolio, configs=[dict(config, verify=args.verify) for config in PORTFOLIO])
+    else:
+        solver = functools.partial(solve_board, **options)
+    report = sys.stderr if args.stats or args.profile else None
+
+    if args.cnf:
+        import sat
+        board = Board.parse_instance()
+        board.constraint_domain()
+        if args.probe is not None or args.probe_seconds is not None:
+            board.probe(args.probe, args.probe_seconds)
+        variables, clauses = board.to_cnf()
+        with open(args.cnf, "w") as cnf_file:
+            sat.write_dimacs(cnf_file, len(variables), clauses,
+                             ["%dx%d board, variable <n> <row> <col> <piece> for every undecided rotation"
+                              % (board.rows, board.cols)] +
+                             ["variable %d %d %d %s" % (variable, *divmod(index, board.cols), MASK_PIECES[value])
+                              for (index, value), variable in variables.items()])
+    elif args.batch is not None:
+        batch_file = sys.stdin if args.batch == "-" else open(args.batch)
+        with batch_file:
+            if args.jobs > 1:
+                run_pool(batch_file, args.jobs, not args.unordered, options=options)
+            else:
+                run_batch(batch_file, solver=solver, report=report)
     else:
-        problem_fix_state.board.propagate_constraints()
\ No newline at end of file
+        if args.regions and args.jobs > 1:
+            solver = functools.partial(solver, jobs=args.jobs)
+        board = Board.parse_instance()
+        stats = {} if report is not None else None
+        if solver(board, stats=stats):
+            board.print_board()
+        if report is not None:
+            print(json.dumps(stats), file=report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""End-to-end benchmark of Pipe.py over a fixed, seeded corpus of boards.
+
+Every board is made by generator.py and solved by running Pipe.py in a
+fresh process, exactly as it is used in production. For each board the
+wall time, the peak resident memory of the solver process and the counters
+it reports with --stats are recorded in a JSON results file.
+
+The cold start of the solver (a fresh process solving a 2x2 board) is
+measured first and recorded with the results. With --startup-only nothing
+else runs and the startup is checked against a time budget instead: the
+check exits with status 1 if the median startup goes over it.
+
+Usage: python benchmark.py [--sizes 5 10 ...] [--seeds 1 2 ...] [--output FILE]
+       python benchmark.py --startup-only [--startup-budget SECONDS]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import generator
+
+PIPE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Pipe.py")
+
+SIZES = (5, 10, 25, 50, 100, 250, 500, 1000)
+SEEDS = (1, 2, 3)
+
+STARTUP_BUDGET = 0.2  # seconds for a fresh solver process on a tiny board
+STARTUP_BOARD = "VB\tVE\nFC\tFC\n"
+
+
+def run_solver(puzzle: str, timeout: float, arguments=()) -> dict:
+    """Runs Pipe.py on one board and measures it. Returns the wall time, the
+    peak RSS in KiB, the exit status, the --stats counters and the output."""
+    with tempfile.TemporaryFile("w+") as stdin, tempfile.TemporaryFile("w+") as stdout, \
+            tempfile.TemporaryFile("w+") as stderr:
+        stdin.write(puzzle)
+        stdin.seek(0)
+        start = time.perf_counter()
+        process = subprocess.Popen([sys.executable, PIPE, "--stats", *arguments],
+                                   stdin=stdin, stdout=stdout, stderr=stderr)
+        timer = threading.Timer(timeout, process.kill)
+        timer.start()
+        _, status, usage = os.wait4(process.pid, 0)
+        wall = time.perf_counter() - start
+        timer.cancel()
+        process.returncode = os.waitstatus_to_exitcode(status)
+
+        stdout.seek(0)
+        stderr.seek(0)
+        output, errors = stdout.read(), stderr.read()
+
+    stats = {}
+    for line in errors.splitlines():
+        if line.startswith("{"):
+            stats = json.loads(line)
+    if process.returncode == 0:
+        status = "solved" if stats.get("solved") else "unsolved"
+    else:
+        status = "timeout" if process.returncode == -9 else "error"
+    return {"status": status, "wall_seconds": round(wall, 4),
+            "peak_rss_kib": usage.ru_maxrss, "stats": stats, "output": output}
+
+
+def measure_startup(runs: int = 5) -> float:
+    """Returns the median wall time of a fresh Pipe.py process solving a 2x2
+    board, which is almost all interpreter start and imports."""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, PIPE], input=STARTUP_BOARD, stdout=subprocess.DEVNULL,
+                       text=True, check=True)
+        times.append(time.perf_counter() - start)
+    return sorted(times)[len(times) // 2]
+
+
+def run_benchmark(sizes=SIZES, seeds=SEEDS, timeout: float = 600.0, arguments=()) -> list:
+    """Generates and solves every (size, seed) board of the corpus."""
+    results = []
+    for size in sizes:
+        for seed in seeds:
+            puzzle, solution = generator.generate(size, size, seed)
+            record = run_solver(generator.format_grid(puzzle), timeout, arguments)
+            record.pop("output")
+            record.update(size=size, seed=seed)
+            results.append(record)
+            print("%5dx%-5d seed %-3d %-9s %9.3fs %9d KiB" % (size, size, seed, record["status"],
+                                                              record["wall_seconds"], record["peak_rss_kib"]),
+                  file=sys.stderr, flush=True)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks Pipe.py on a seeded corpus of random boards.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, metavar="N")
+    parser.add_argument("--seeds", type=int, nargs="+", default=SEEDS, metavar="SEED")
+    parser.add_argument("--timeout", type=float, default=600.0, help="seconds allowed per board")
+    parser.add_argument("--output", default="benchmark_results.json", help="results file (JSON)")
+    parser.add_argument("--startup-only", action="store_true",
+                        help="only check the median solver startup against --startup-budget")
+    parser.add_argument("--startup-budget", type=float, default=STARTUP_BUDGET, metavar="SECONDS",
+                        help="with --startup-only, fail if the startup takes longer (default: %(default)s)")
+    args = parser.parse_args()
+
+    startup = measure_startup()
+    if args.startup_only:
+        print("startup %.3fs (budget %.3fs)" % (startup, args.startup_budget), file=sys.stderr, flush=True)
+        if startup > args.startup_budget:
+            sys.exit("startup of %.3fs is over the budget of %.3fs" % (startup, args.startup_budget))
+        sys.exit(0)
+    print("startup %.3fs" % startup, file=sys.stderr, flush=True)
+    results = run_benchmark(args.sizes, args.seeds, args.timeout)
+    with open(args.output, "w") as results_file:
+        json.dump({"python": sys.version.split()[0], "startup_seconds": round(startup, 4), "results": results},
+                  results_file, indent=2)
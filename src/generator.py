@@ -0,0 +1,92 @@
+"""Random PipeMania boards with a known solution.
+
+A board is built as a random spanning tree of the grid in which no cell has
+more than three connections, so every cell maps to one of the F, B, V or L
+pieces. The puzzle is the same network with every piece given a random
+rotation.
+
+Usage: python generator.py ROWS [COLS] [--seed SEED] [--solution FILE]
+"""
+
+import argparse
+import random
+import sys
+from typing import List, Tuple
+
+from Pipe import DIRECTION_OFFSETS, MASK_PIECES, OPEN_ENDS
+
+
+def rotate(mask: int, turns: int) -> int:
+    """Rotates a connectivity mask clockwise by `turns` quarter turns."""
+    for _ in range(turns):
+        mask = (mask << 1 | mask >> 3) & 15
+    return mask
+
+
+def spanning_tree(rows: int, cols: int, rng: random.Random) -> bytearray:
+    """Grows a random spanning tree from a random cell, taking a random
+    frontier edge each step and never giving a cell a fourth connection.
+    Returns the mask of every cell, or None if the tree got stuck."""
+    cells = rows * cols
+    masks = bytearray(cells)
+    in_tree = bytearray(cells)
+    frontier = []
+
+    def grow(index: int):
+        in_tree[index] = 1
+        row, col = divmod(index, cols)
+        for direction, (d_row, d_col) in enumerate(DIRECTION_OFFSETS):
+            if 0 <= row + d_row < rows and 0 <= col + d_col < cols:
+                frontier.append((index, direction))
+
+    grow(rng.randrange(cells))
+    size = 1
+    while frontier:
+        position = rng.randrange(len(frontier))
+        frontier[position], frontier[-1] = frontier[-1], frontier[position]
+        index, direction = frontier.pop()
+        d_row, d_col = DIRECTION_OFFSETS[direction]
+        neighbour = index + d_row * cols + d_col
+        if in_tree[neighbour] or OPEN_ENDS[masks[index]] == 3:
+            continue
+        masks[index] |= 1 << direction
+        masks[neighbour] |= 1 << (direction + 2) % 4
+        grow(neighbour)
+        size += 1
+    return masks if size == cells else None
+
+
+def generate(rows: int, cols: int = None, seed: int = None) -> Tuple[List[List[str]], List[List[str]]]:
+    """Returns a scrambled puzzle and its solution as grids of piece codes."""
+    cols = rows if cols is None else cols
+    if rows * cols < 2:
+        raise ValueError("a board needs at least two cells")
+    rng = random.Random(seed)
+    masks = None
+    while masks is None:
+        masks = spanning_tree(rows, cols, rng)
+
+    solution = [[MASK_PIECES[masks[row * cols + col]] for col in range(cols)] for row in range(rows)]
+    puzzle = [[MASK_PIECES[rotate(masks[row * cols + col], rng.randrange(4))] for col in range(cols)]
+              for row in range(rows)]
+    return puzzle, solution
+
+
+def format_grid(grid: List[List[str]]) -> str:
+    """Formats a grid in the input format of Pipe.py."""
+    return "".join("\t".join(row) + "\n" for row in grid)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Writes a random solvable PipeMania board to stdout.")
+    parser.add_argument("rows", type=int)
+    parser.add_argument("cols", type=int, nargs="?")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--solution", metavar="FILE", help="also write the solution to FILE")
+    args = parser.parse_args()
+
+    puzzle, solution = generate(args.rows, args.cols, args.seed)
+    sys.stdout.write(format_grid(puzzle))
+    if args.solution:
+        with open(args.solution, "w") as solution_file:
+            solution_file.write(format_grid(solution))
@@ -0,0 +1,356 @@
+"""A small CDCL SAT solver and DIMACS reader and writer.
+
+Clauses come in and models go out in DIMACS form: variables are numbered
+from 1, and the literal v means variable v is true and -v that it is false.
+Inside the solver the literal of variable v is 2 * v when true and
+2 * v + 1 when false, so negating a literal is `literal ^ 1`.
+
+The solver keeps two watched literals per clause, learns a first-UIP clause
+from every conflict and backjumps to its second highest level, branches on
+the most active variable with its last polarity, restarts on the Luby
+sequence and halves its learnt clauses when there are too many. Clauses can
+be added between calls to solve, which keeps everything learnt so far.
+"""
+
+import heapq
+from typing import Iterable, List, Optional, TextIO, Tuple
+
+RESTART_BASE = 100  # conflicts per unit of the Luby sequence
+ACTIVITY_DECAY = 0.95
+TRUE, FALSE = 1, 2  # values of a literal; 0 is unassigned
+
+
+def luby(index: int) -> int:
+    """The index-th term (from 0) of the Luby sequence 1 1 2 1 1 2 4 1 ..."""
+    size, power = 1, 0
+    while size < index + 1:
+        power += 1
+        size = 2 * size + 1
+    while size - 1 != index:
+        size = (size - 1) >> 1
+        power -= 1
+        index %= size
+    return 1 << power
+
+
+def read_dimacs(file: TextIO) -> Tuple[int, List[List[int]]]:
+    """Reads a CNF in DIMACS format. Returns its number of variables and its clauses."""
+    num_vars = 0
+    clauses = []
+    clause = []
+    for line in file:
+        fields = line.split()
+        if not fields or fields[0] == "c":
+            continue
+        if fields[0] == "p":
+            if len(fields) != 4 or fields[1] != "cnf":
+                raise ValueError("bad problem line: %r" % line.strip())
+            num_vars = int(fields[2])
+            continue
+        for field in fields:
+            literal = int(field)
+            if literal == 0:
+                clauses.append(clause)
+                clause = []
+            else:
+                clause.append(literal)
+    if clause:
+        clauses.append(clause)
+    return num_vars, clauses
+
+
+def write_dimacs(file: TextIO, num_vars: int, clauses: List[List[int]], comments: Iterable[str] = ()):
+    """Writes a CNF in DIMACS format, with optional comment lines first."""
+    for comment in comments:
+        file.write("c %s\n" % comment)
+    file.write("p cnf %d %d\n" % (num_vars, len(clauses)))
+    for clause in clauses:
+        file.write(" ".join(map(str, clause)) + " 0\n")
+
+
+class Solver:
+    """Conflict-driven clause learning over a growing set of clauses."""
+
+    def __init__(self, num_vars: int = 0):
+        self.num_vars = 0
+        self.value = bytearray(2)  # per literal: TRUE, FALSE or 0
+        self.level = [0]  # per variable, the decision level it was assigned at
+        self.reason = [None]  # per variable, the clause that implied it
+        self.activity = [0.0]
+        self.phase = bytearray(1)  # per variable, 0 or 1 for its last polarity
+        self.watches = [[], []]  # per literal, the clauses watching it
+        self.seen = bytearray(1)
+        self.trail = []
+        self.trail_lim = []  # trail length at the start of each decision level
+        self.head = 0  # next trail literal to propagate
+        self.heap = []  # (-activity, variable), with stale entries
+        self.clauses = []
+        self.learnts = []
+        self.ok = True  # False once the clauses are known to be unsatisfiable
+        self.increment = 1.0
+        self.max_learnts = 0
+        self.decisions = self.conflicts = self.propagations = self.restarts = 0
+        for _ in range(num_vars):
+            self.new_var()
+
+    def new_var(self) -> int:
+        """Adds a variable and returns its DIMACS number."""
+        self.num_vars += 1
+        self.value.extend(b"\0\0")
+        self.level.append(0)
+        self.reason.append(None)
+        self.activity.append(0.0)
+        self.phase.append(1)
+        self.watches.extend(([], []))
+        self.seen.append(0)
+        heapq.heappush(self.heap, (0.0, self.num_vars))
+        return self.num_vars
+
+    def add_clause(self, clause: Iterable[int]) -> bool:
+        """Adds a clause of DIMACS literals, undoing any decisions first.
+        Returns False if the clauses are now known to be unsatisfiable."""
+        if not self.ok:
+            return False
+        self.backtrack(0)
+        value = self.value
+        literals = []
+        for literal in clause:
+            if abs(literal) > self.num_vars:
+                raise ValueError("literal %d names an unknown variable" % literal)
+            literal = 2 * literal if literal > 0 else -2 * literal + 1
+            if value[literal] == TRUE or literal ^ 1 in literals:
+                return True
+            if value[literal] != FALSE and literal not in literals:
+                literals.append(literal)
+        if not literals:
+            self.ok = False
+        elif len(literals) == 1:
+            self.assign(literals[0], None)
+            self.ok = self.propagate() is None
+        else:
+            self.watch(literals)
+            self.clauses.append(literals)
+        return self.ok
+
+    def watch(self, clause: List[int]):
+        self.watches[clause[0]].append(clause)
+        self.watches[clause[1]].append(clause)
+
+    def assign(self, literal: int, reason: Optional[List[int]]):
+        self.value[literal] = TRUE
+        self.value[literal ^ 1] = FALSE
+        variable = literal >> 1
+        self.level[variable] = len(self.trail_lim)
+        self.reason[variable] = reason
+        self.trail.append(literal)
+
+    def propagate(self) -> Optional[List[int]]:
+        """Unit propagation of the trail. Returns a conflicting clause, or None."""
+        value, watches, trail = self.value, self.watches, self.trail
+        while self.head < len(trail):
+            false_literal = trail[self.head] ^ 1
+            self.head += 1
+            self.propagations += 1
+            watchers = watches[false_literal]
+            count = len(watchers)
+            i = j = 0
+            while i < count:
+                clause = watchers[i]
+                i += 1
+                if not clause:
+                    continue  # deleted by reduce
+                if clause[0] == false_literal:
+                    clause[0], clause[1] = clause[1], false_literal
+                first = clause[0]
+                if value[first] == TRUE:
+                    watchers[j] = clause
+                    j += 1
+                    continue
+                for k in range(2, len(clause)):
+                    other = clause[k]
+                    if value[other] != FALSE:
+                        clause[1], clause[k] = other, false_literal
+                        watches[other].append(clause)
+                        break
+                else:
+                    watchers[j] = clause
+                    j += 1
+                    if value[first] == FALSE:
+                        while i < count:
+                            watchers[j] = watchers[i]
+                            i += 1
+                            j += 1
+                        del watchers[j:]
+                        self.head = len(trail)
+                        return clause
+                    self.assign(first, clause)
+            del watchers[j:]
+        return None
+
+    def bump(self, variable: int):
+        activity = self.activity[variable] + self.increment
+        self.activity[variable] = activity
+        if activity > 1e100:
+            self.activity = [a * 1e-100 for a in self.activity]
+            self.increment *= 1e-100
+            self.rebuild_heap()
+        elif not self.value[2 * variable]:
+            heapq.heappush(self.heap, (-activity, variable))
+
+    def rebuild_heap(self):
+        value, activity = self.value, self.activity
+        self.heap = [(-activity[v], v) for v in range(1, self.num_vars + 1) if not value[2 * v]]
+        heapq.heapify(self.heap)
+
+    def analyze(self, conflict: List[int]) -> Tuple[List[int], int]:
+        """Derives the first-UIP clause of a conflict. Returns it, with its
+        asserting literal first, and the level to backjump to."""
+        seen, level, reason, trail = self.seen, self.level, self.reason, self.trail
+        current = len(self.trail_lim)
+        learnt = [0]
+        pending = 0
+        index = len(trail) - 1
+        clause, literal = conflict, None
+        while True:
+            for other in (clause if literal is None else clause[1:]):
+                variable = other >> 1
+                if not seen[variable] and level[variable] > 0:
+                    seen[variable] = 1
+                    self.bump(variable)
+                    if level[variable] >= current:
+                        pending += 1
+                    else:
+                        learnt.append(other)
+            while not seen[trail[index] >> 1]:
+                index -= 1
+            literal = trail[index]
+            index -= 1
+            variable = literal >> 1
+            clause = reason[variable]
+            seen[variable] = 0
+            pending -= 1
+            if not pending:
+                break
+        learnt[0] = literal ^ 1
+
+        # Drop the literals implied by the others (local minimization)
+        kept = [learnt[0]]
+        for other in learnt[1:]:
+            clause = reason[other >> 1]
+            if clause is None or any(not seen[q >> 1] and level[q >> 1] > 0 for q in clause[1:]):
+                kept.append(other)
+        for other in learnt[1:]:
+            seen[other >> 1] = 0
+
+        if len(kept) == 1:
+            return kept, 0
+        highest = max(range(1, len(kept)), key=lambda position: level[kept[position] >> 1])
+        kept[1], kept[highest] = kept[highest], kept[1]
+        return kept, level[kept[1] >> 1]
+
+    def backtrack(self, target: int):
+        """Unassigns every decision level above `target`."""
+        if len(self.trail_lim) <= target:
+            return
+        value, phase, activity, heap = self.value, self.phase, self.activity, self.heap
+        mark = self.trail_lim[target]
+        for literal in self.trail[mark:]:
+            value[literal] = value[literal ^ 1] = 0
+            variable = literal >> 1
+            phase[variable] = literal & 1
+            heapq.heappush(heap, (-activity[variable], variable))
+        del self.trail[mark:]
+        del self.trail_lim[target:]
+        self.head = mark
+        if len(heap) > 4 * self.num_vars + 64:
+            self.rebuild_heap()
+
+    def pick(self) -> Optional[int]:
+        """The unassigned variable of highest activity, as a literal of its saved phase."""
+        value, heap = self.value, self.heap
+        while heap:
+            variable = heapq.heappop(heap)[1]
+            if not value[2 * variable]:
+                return 2 * variable + self.phase[variable]
+        return None
+
+    def reduce(self):
+        """Deletes the longer half of the learnt clauses, except those that
+        are the reason of a current assignment. Deleted clauses are emptied
+        and dropped from the watch lists as propagate meets them."""
+        reason, value = self.reason, self.value
+        self.learnts.sort(key=len)
+        keep = len(self.learnts) // 2
+        kept = self.learnts[:keep]
+        for clause in self.learnts[keep:]:
+            if reason[clause[0] >> 1] is clause and value[clause[0]] == TRUE or len(clause) <= 2:
+                kept.append(clause)
+            else:
+                clause.clear()
+        self.learnts = kept
+
+    def solve(self, conflict_limit: int = None) -> Optional[List[bool]]:
+        """Searches for a model of the clauses. Returns the value of every
+        variable (index 0 unused), or None if they are unsatisfiable or
+        `conflict_limit` conflicts went by, which `ok` tells apart."""
+        if not self.ok:
+            return None
+        self.max_learnts = max(self.max_learnts, len(self.clauses) // 3, 1000)
+        restart, budget = 0, luby(0) * RESTART_BASE
+        conflicts = 0
+        while True:
+            conflict = self.propagate()
+            if conflict is not None:
+                self.conflicts += 1
+                conflicts += 1
+                budget -= 1
+                if not self.trail_lim:
+                    self.ok = False
+                    return None
+                learnt, level = self.analyze(conflict)
+                self.backtrack(level)
+                if len(learnt) == 1:
+                    self.assign(learnt[0], None)
+                else:
+                    self.watch(learnt)
+                    self.learnts.append(learnt)
+                    self.assign(learnt[0], learnt)
+                self.increment /= ACTIVITY_DECAY
+                continue
+
+            if conflict_limit is not None and conflicts >= conflict_limit:
+                self.backtrack(0)
+                return None
+            if budget <= 0:
+                self.restarts += 1
+                restart += 1
+                budget = luby(restart) * RESTART_BASE
+                self.backtrack(0)
+            if len(self.learnts) >= self.max_learnts:
+                self.reduce()
+                self.max_learnts = int(self.max_learnts * 1.1)
+
+            literal = self.pick()
+            if literal is None:
+                value = self.value
+                model = [False] + [value[2 * v] == TRUE for v in range(1, self.num_vars + 1)]
+                self.backtrack(0)
+                return model
+            self.decisions += 1
+            self.trail_lim.append(len(self.trail))
+            self.assign(literal, None)
+
+
+if __name__ == "__main__":
+    import sys
+
+    num_vars, clauses = read_dimacs(sys.stdin)
+    solver = Solver(num_vars)
+    for clause in clauses:
+        solver.add_clause(clause)
+    model = solver.solve()
+    if model is None:
+        print("s UNSATISFIABLE")
+    else:
+        print("s SATISFIABLE")
+        print("v " + " ".join(str(v if model[v] else -v) for v in range(1, num_vars + 1)) + " 0")
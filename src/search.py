@@ -130,6 +130,50 @@ class Node:
         return hash(self.state)
 
 
+class LeanNode:
+    """A search tree node with __slots__ that keeps no parent and no action,
+    only its state, depth and path_cost, and fixed fields for the f and h
+    values that best_first_graph_search and astar_search cache on it. It is
+    for searches where only the goal state matters: the nodes above a
+    frontier entry are freed as soon as they are expanded, and solution()
+    and path() know nothing before the node itself. Pass it as node_class
+    to the searches below."""
+
+    __slots__ = ('state', 'path_cost', 'depth', 'f', 'h')
+    parent = action = None
+
+    def __init__(self, state, parent=None, action=None, path_cost=0):
+        self.state = state
+        self.path_cost = path_cost
+        self.depth = parent.depth + 1 if parent else 0
+
+    def child_node(self, problem, action):
+        next_state = problem.result(self.state, action)
+        return type(self)(next_state, self, action, problem.path_cost(self.path_cost, self.state, action, next_state))
+
+    def __eq__(self, other):
+        return isinstance(other, LeanNode) and self.state == other.state
+
+    __repr__ = Node.__repr__
+    __lt__ = Node.__lt__
+    __hash__ = Node.__hash__
+    expand = Node.expand
+    solution = Node.solution
+    path = Node.path
+
+
+class SlotNode(LeanNode):
+    """A LeanNode that keeps its parent and action as well: a Node with
+    __slots__, and fixed fields for f and h instead of a __dict__."""
+
+    __slots__ = ('parent', 'action')
+
+    def __init__(self, state, parent=None, action=None, path_cost=0):
+        super().__init__(state, parent, action, path_cost)
+        self.parent = parent
+        self.action = action
+
+
 # ______________________________________________________________________________
 
 
@@ -175,7 +219,7 @@ class SimpleProblemSolvingAgentProgram:
 # Uninformed Search algorithms
 
 
-def breadth_first_tree_search(problem):
+def breadth_first_tree_search(problem, node_class=Node):
     """
     [Figure 3.7]
     Search the shallowest nodes in the search tree first.
@@ -184,7 +228,7 @@ def breadth_first_tree_search(problem):
     Repeats infinitely in case of loops.
     """
 
-    frontier = deque([Node(problem.initial)])  # FIFO queue
+    frontier = deque([node_class(problem.initial)])  # FIFO queue
 
     while frontier:
         node = frontier.popleft()
@@ -194,7 +238,7 @@ def breadth_first_tree_search(problem):
     return None
 
 
-def depth_first_tree_search(problem):
+def depth_first_tree_search(problem, node_class=Node):
     """
     [Figure 3.7]
     Search the deepest nodes in the search tree first.
@@ -203,7 +247,7 @@ def depth_first_tree_search(problem):
     Repeats infinitely in case of loops.
     """
 
-    frontier = [Node(problem.initial)]  # Stack
+    frontier = [node_class(problem.initial)]  # Stack
 
     while frontier:
         node = frontier.pop()
@@ -213,7 +257,7 @@ def depth_first_tree_search(problem):
     return None
 
 
-def depth_first_graph_search(problem):
+def depth_first_graph_search(problem, node_class=Node):
     """
     [Figure 3.7]
     Search the deepest nodes in the search tree first.
@@ -222,7 +266,7 @@ def depth_first_graph_search(problem):
     Does not get trapped by loops.
     If two paths reach a state, only use the first one.
     """
-    frontier = [(Node(problem.initial))]  # Stack
+    frontier = [(node_class(problem.initial))]  # Stack
 
     explored = set()
     while frontier:
@@ -235,13 +279,13 @@ def depth_first_graph_search(problem):
     return None
 
 
-def breadth_first_graph_search(problem):
+def breadth_first_graph_search(problem, node_class=Node):
     """[Figure 3.11]
     Note that this function can be implemented in a
     single line as below:
     return graph_search(problem, FIFOQueue())
     """
-    node = Node(problem.initial)
+    node = node_class(problem.initial)
     if problem.goal_test(node.state):
         return node
     frontier = deque([node])
@@ -257,7 +301,7 @@ def breadth_first_graph_search(problem):
     return None
 
 
-def best_first_graph_search(problem, f, display=False):
+def best_first_graph_search(problem, f, display=False, node_class=Node):
     """Search the nodes with the lowest f scores first.
     You specify the function f(node) that you want to minimize; for example,
     if f is a heuristic estimate to the goal, then we have greedy best
@@ -266,7 +310,7 @@ def best_first_graph_search(problem, f, display=False):
     values will be cached on the nodes as they are computed. So after doing
     a best first search you can examine the f values of the path returned."""
     f = memoize(f, 'f')
-    node = Node(problem.initial)
+    node = node_class(problem.initial)
     frontier = PriorityQueue('min', f)
     frontier.append(node)
     explored = set()
@@ -287,12 +331,12 @@ def best_first_graph_search(problem, f, display=False):
     return None
 
 
-def uniform_cost_search(problem, display=False):
+def uniform_cost_search(problem, display=False, node_class=Node):
     """[Figure 3.14]"""
-    return best_first_graph_search(problem, lambda node: node.path_cost, display)
+    return best_first_graph_search(problem, lambda node: node.path_cost, display, node_class)
 
 
-def depth_limited_search(problem, limit=50):
+def depth_limited_search(problem, limit=50, node_class=Node):
     """[Figure 3.17]"""
 
     def recursive_dls(node, problem, limit):
@@ -311,13 +355,13 @@ def depth_limited_search(problem, limit=50):
             return 'cutoff' if cutoff_occurred else None
 
     # Body of depth_limited_search:
-    return recursive_dls(Node(problem.initial), problem, limit)
+    return recursive_dls(node_class(problem.initial), problem, limit)
 
 
-def iterative_deepening_search(problem):
+def iterative_deepening_search(problem, node_class=Node):
     """[Figure 3.18]"""
     for depth in range(sys.maxsize):
-        result = depth_limited_search(problem, depth)
+        result = depth_limited_search(problem, depth, node_class)
         if result != 'cutoff':
             return result
 
@@ -326,12 +370,12 @@ def iterative_deepening_search(problem):
 # Bidirectional Search
 # Pseudocode from https://webdocs.cs.ualberta.ca/%7Eholte/Publications/MM-AAAI2016.pdf
 
-def bidirectional_search(problem):
+def bidirectional_search(problem, node_class=Node):
     e = 0
     if isinstance(problem, GraphProblem):
         e = problem.find_min_edge()
-    gF, gB = {Node(problem.initial): 0}, {Node(problem.goal): 0}
-    openF, openB = [Node(problem.initial)], [Node(problem.goal)]
+    gF, gB = {node_class(problem.initial): 0}, {node_class(problem.goal): 0}
+    openF, openB = [node_class(problem.initial)], [node_class(problem.goal)]
     closedF, closedB = [], []
     U = np.inf
 
@@ -374,7 +418,7 @@ def bidirectional_search(problem):
         """Finds key in open_dir with value equal to pr_min
         and minimum g value."""
         m = np.inf
-        node = Node(-1)
+        node = node_class(-1)
         for n in open_dir:
             pr = max(g[n] + problem.h(n), 2 * g[n])
             if pr == pr_min:
@@ -410,17 +454,17 @@ greedy_best_first_graph_search = best_first_graph_search
 
 
 # Greedy best-first search is accomplished by specifying f(n) = h(n).
-def greedy_search(problem, h=None):
+def greedy_search(problem, h=None, node_class=Node):
     """f(n) = h(n)"""
     h = memoize(h or problem.h, 'h')
-    return best_first_graph_search(problem, h)
+    return best_first_graph_search(problem, h, node_class=node_class)
 
-def astar_search(problem, h=None, display=False):
+def astar_search(problem, h=None, display=False, node_class=Node):
     """A* search is best-first graph search with f(n) = g(n)+h(n).
     You need to specify the h function when you call astar_search, or
     else in your Problem subclass."""
     h = memoize(h or problem.h, 'h')
-    return best_first_graph_search(problem, lambda n: n.path_cost + h(n), display)
+    return best_first_graph_search(problem, lambda n: n.path_cost + h(n), display, node_class)
 
 
 # ______________________________________________________________________________
@@ -603,7 +647,7 @@ class PlanRoute(Problem):
 # Other search algorithms
 
 
-def recursive_best_first_search(problem, h=None):
+def recursive_best_first_search(problem, h=None, node_class=Node):
     """[Figure 3.26]"""
     h = memoize(h or problem.h, 'h')
 
@@ -629,19 +673,19 @@ def recursive_best_first_search(problem, h=None):
             if result is not None:
                 return result, best.f
 
-    node = Node(problem.initial)
+    node = node_class(problem.initial)
     node.f = h(node)
     result, bestf = RBFS(problem, node, np.inf)
     return result
 
 
-def hill_climbing(problem):
+def hill_climbing(problem, node_class=Node):
     """
     [Figure 4.2]
     From the initial node, keep choosing the neighbor with highest value,
     stopping when no neighbor is better.
     """
-    current = Node(problem.initial)
+    current = node_class(problem.initial)
     while True:
         neighbors = current.expand(problem)
         if not neighbors:
@@ -658,10 +702,10 @@ def exp_schedule(k=20, lam=0.005, limit=100):
     return lambda t: (k * np.exp(-lam * t) if t < limit else 0)
 
 
-def simulated_annealing(problem, schedule=exp_schedule()):
+def simulated_annealing(problem, schedule=exp_schedule(), node_class=Node):
     """[Figure 4.5] CAUTION: This differs from the pseudocode as it
     returns a state instead of a Node."""
-    current = Node(problem.initial)
+    current = node_class(problem.initial)
     for t in range(sys.maxsize):
         T = schedule(t)
         if T == 0:
@@ -675,11 +719,11 @@ def simulated_annealing(problem, schedule=exp_schedule()):
             current = next_choice
 
 
-def simulated_annealing_full(problem, schedule=exp_schedule()):
+def simulated_annealing_full(problem, schedule=exp_schedule(), node_class=Node):
     """ This version returns all the states encountered in reaching
     the goal state."""
     states = []
-    current = Node(problem.initial)
+    current = node_class(problem.initial)
     for t in range(sys.maxsize):
         states.append(current.state)
         T = schedule(t)
@@ -1096,87 +1140,98 @@ def RandomGraph(nodes=list(range(10)), min_links=2, width=400, height=300,
     return g
 
 
-""" [Figure 3.2]
-Simplified road map of Romania
-"""
-romania_map = UndirectedGraph(dict(
-    Arad=dict(Zerind=75, Sibiu=140, Timisoara=118),
-    Bucharest=dict(Urziceni=85, Pitesti=101, Giurgiu=90, Fagaras=211),
-    Craiova=dict(Drobeta=120, Rimnicu=146, Pitesti=138),
-    Drobeta=dict(Mehadia=75),
-    Eforie=dict(Hirsova=86),
-    Fagaras=dict(Sibiu=99),
-    Hirsova=dict(Urziceni=98),
-    Iasi=dict(Vaslui=92, Neamt=87),
-    Lugoj=dict(Timisoara=111, Mehadia=70),
-    Oradea=dict(Zerind=71, Sibiu=151),
-    Pitesti=dict(Rimnicu=97),
-    Rimnicu=dict(Sibiu=80),
-    Urziceni=dict(Vaslui=142)))
-romania_map.locations = dict(
-    Arad=(91, 492), Bucharest=(400, 327), Craiova=(253, 288),
-    Drobeta=(165, 299), Eforie=(562, 293), Fagaras=(305, 449),
-    Giurgiu=(375, 270), Hirsova=(534, 350), Iasi=(473, 506),
-    Lugoj=(165, 379), Mehadia=(168, 339), Neamt=(406, 537),
-    Oradea=(131, 571), Pitesti=(320, 368), Rimnicu=(233, 410),
-    Sibiu=(207, 457), Timisoara=(94, 410), Urziceni=(456, 350),
-    Vaslui=(509, 444), Zerind=(108, 531))
-
-""" [Figure 4.9]
-Eight possible states of the vacumm world
-Each state is represented as
-   *       "State of the left room"      "State of the right room"   "Room in which the agent
-                                                                      is present"
-1 - DDL     Dirty                         Dirty                       Left
-2 - DDR     Dirty                         Dirty                       Right
-3 - DCL     Dirty                         Clean                       Left
-4 - DCR     Dirty                         Clean                       Right
-5 - CDL     Clean                         Dirty                       Left
-6 - CDR     Clean                         Dirty                       Right
-7 - CCL     Clean                         Clean                       Left
-8 - CCR     Clean                         Clean                       Right
-"""
-vacuum_world = Graph(dict(
-    State_1=dict(Suck=['State_7', 'State_5'], Right=['State_2']),
-    State_2=dict(Suck=['State_8', 'State_4'], Left=['State_2']),
-    State_3=dict(Suck=['State_7'], Right=['State_4']),
-    State_4=dict(Suck=['State_4', 'State_2'], Left=['State_3']),
-    State_5=dict(Suck=['State_5', 'State_1'], Right=['State_6']),
-    State_6=dict(Suck=['State_8'], Left=['State_5']),
-    State_7=dict(Suck=['State_7', 'State_3'], Right=['State_8']),
-    State_8=dict(Suck=['State_8', 'State_6'], Left=['State_7'])
-))
-
-""" [Figure 4.23]
-One-dimensional state space Graph
-"""
-one_dim_state_space = Graph(dict(
-    State_1=dict(Right='State_2'),
-    State_2=dict(Right='State_3', Left='State_1'),
-    State_3=dict(Right='State_4', Left='State_2'),
-    State_4=dict(Right='State_5', Left='State_3'),
-    State_5=dict(Right='State_6', Left='State_4'),
-    State_6=dict(Left='State_5')
-))
-one_dim_state_space.least_costs = dict(
-    State_1=8,
-    State_2=9,
-    State_3=2,
-    State_4=2,
-    State_5=4,
-    State_6=3)
-
-""" [Figure 6.1]
-Principal states and territories of Australia
-"""
-australia_map = UndirectedGraph(dict(
-    T=dict(),
-    SA=dict(WA=1, NT=1, Q=1, NSW=1, V=1),
-    NT=dict(WA=1, Q=1),
-    NSW=dict(Q=1, V=1)))
-australia_map.locations = dict(WA=(120, 24), NT=(135, 20), SA=(135, 30),
-                               Q=(145, 20), NSW=(145, 32), T=(145, 42),
-                               V=(145, 37))
+def make_romania_map():
+    """[Figure 3.2]
+    Simplified road map of Romania
+    """
+    romania_map = UndirectedGraph(dict(
+        Arad=dict(Zerind=75, Sibiu=140, Timisoara=118),
+        Bucharest=dict(Urziceni=85, Pitesti=101, Giurgiu=90, Fagaras=211),
+        Craiova=dict(Drobeta=120, Rimnicu=146, Pitesti=138),
+        Drobeta=dict(Mehadia=75),
+        Eforie=dict(Hirsova=86),
+        Fagaras=dict(Sibiu=99),
+        Hirsova=dict(Urziceni=98),
+        Iasi=dict(Vaslui=92, Neamt=87),
+        Lugoj=dict(Timisoara=111, Mehadia=70),
+        Oradea=dict(Zerind=71, Sibiu=151),
+        Pitesti=dict(Rimnicu=97),
+        Rimnicu=dict(Sibiu=80),
+        Urziceni=dict(Vaslui=142)))
+    romania_map.locations = dict(
+        Arad=(91, 492), Bucharest=(400, 327), Craiova=(253, 288),
+        Drobeta=(165, 299), Eforie=(562, 293), Fagaras=(305, 449),
+        Giurgiu=(375, 270), Hirsova=(534, 350), Iasi=(473, 506),
+        Lugoj=(165, 379), Mehadia=(168, 339), Neamt=(406, 537),
+        Oradea=(131, 571), Pitesti=(320, 368), Rimnicu=(233, 410),
+        Sibiu=(207, 457), Timisoara=(94, 410), Urziceni=(456, 350),
+        Vaslui=(509, 444), Zerind=(108, 531))
+    return romania_map
+
+
+def make_vacuum_world():
+    """[Figure 4.9]
+    Eight possible states of the vacumm world
+    Each state is represented as
+       *       "State of the left room"      "State of the right room"   "Room in which the agent
+                                                                          is present"
+    1 - DDL     Dirty                         Dirty                       Left
+    2 - DDR     Dirty                         Dirty                       Right
+    3 - DCL     Dirty                         Clean                       Left
+    4 - DCR     Dirty                         Clean                       Right
+    5 - CDL     Clean                         Dirty                       Left
+    6 - CDR     Clean                         Dirty                       Right
+    7 - CCL     Clean                         Clean                       Left
+    8 - CCR     Clean                         Clean                       Right
+    """
+    vacuum_world = Graph(dict(
+        State_1=dict(Suck=['State_7', 'State_5'], Right=['State_2']),
+        State_2=dict(Suck=['State_8', 'State_4'], Left=['State_2']),
+        State_3=dict(Suck=['State_7'], Right=['State_4']),
+        State_4=dict(Suck=['State_4', 'State_2'], Left=['State_3']),
+        State_5=dict(Suck=['State_5', 'State_1'], Right=['State_6']),
+        State_6=dict(Suck=['State_8'], Left=['State_5']),
+        State_7=dict(Suck=['State_7', 'State_3'], Right=['State_8']),
+        State_8=dict(Suck=['State_8', 'State_6'], Left=['State_7'])
+    ))
+    return vacuum_world
+
+
+def make_one_dim_state_space():
+    """[Figure 4.23]
+    One-dimensional state space Graph
+    """
+    one_dim_state_space = Graph(dict(
+        State_1=dict(Right='State_2'),
+        State_2=dict(Right='State_3', Left='State_1'),
+        State_3=dict(Right='State_4', Left='State_2'),
+        State_4=dict(Right='State_5', Left='State_3'),
+        State_5=dict(Right='State_6', Left='State_4'),
+        State_6=dict(Left='State_5')
+    ))
+    one_dim_state_space.least_costs = dict(
+        State_1=8,
+        State_2=9,
+        State_3=2,
+        State_4=2,
+        State_5=4,
+        State_6=3)
+    return one_dim_state_space
+
+
+def make_australia_map():
+    """[Figure 6.1]
+    Principal states and territories of Australia
+    """
+    australia_map = UndirectedGraph(dict(
+        T=dict(),
+        SA=dict(WA=1, NT=1, Q=1, NSW=1, V=1),
+        NT=dict(WA=1, Q=1),
+        NSW=dict(Q=1, V=1)))
+    australia_map.locations = dict(WA=(120, 24), NT=(135, 20), SA=(135, 30),
+                                   Q=(145, 20), NSW=(145, 32), T=(145, 42),
+                                   V=(145, 37))
+    return australia_map
 
 
 class GraphProblem(Problem):
@@ -1322,7 +1377,27 @@ def random_boggle(n=4):
 # 2274 words, for a score of 9837
 
 
-boyan_best = list('RSTCSDEIAEGNLRPEATESMSSID')
+def make_boyan_best():
+    return list('RSTCSDEIAEGNLRPEATESMSSID')
+
+
+# Example objects of this module, built by __getattr__ the first time they are used.
+EXAMPLES = {
+    'romania_map': make_romania_map,
+    'vacuum_world': make_vacuum_world,
+    'one_dim_state_space': make_one_dim_state_space,
+    'australia_map': make_australia_map,
+    'boyan_best': make_boyan_best,
+}
+
+
+def __getattr__(name):
+    """Builds the example graphs and Boggle boards on first access, so that
+    importing this module stays cheap."""
+    if name in EXAMPLES:
+        value = globals()[name] = EXAMPLES[name]()
+        return value
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
 
 
 def print_boggle(board):
@@ -1572,6 +1647,7 @@ def compare_searchers(problems, header,
 
 def compare_graph_searchers():
     """Prints a table of search results."""
+    romania_map, australia_map = __getattr__('romania_map'), __getattr__('australia_map')
     compare_searchers(problems=[GraphProblem('Arad', 'Bucharest', romania_map),
                                 GraphProblem('Oradea', 'Neamt', romania_map),
                                 GraphProblem('Q', 'WA', australia_map)],
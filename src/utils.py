@@ -5,13 +5,34 @@ import collections
 import collections.abc
 import functools
 import heapq
+import importlib
 import operator
 import os.path
 import random
 from itertools import chain, combinations
-from statistics import mean
 
-import numpy as np
+
+class LazyModule:
+    """Stands in for a module that is only imported on first attribute access,
+    so importing utils does not pay for numpy."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+np = LazyModule('numpy')
+
+
+def mean(data):
+    """statistics.mean, imported on first use."""
+    from statistics import mean
+    return mean(data)
 
 
 # ______________________________________________________________________________